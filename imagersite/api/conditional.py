@@ -0,0 +1,36 @@
+"""Answer repeated API list requests with 304 Not Modified."""
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+from imager_images.views import make_etag
+
+
+def list_etag(view, request):
+    """Return ETag of the list view's response to request.
+
+    The count and latest date_modified of the listed items change with
+    every addition, edit or deletion, and when renditions are made, and
+    are read in one aggregate query. The full path covers the page
+    cursor and query parameters.
+    """
+    queryset = view.filter_queryset(view.get_queryset())
+    state = queryset.order_by().aggregate(
+        count=Count('pk'), latest=Max('date_modified'))
+    return make_etag(queryset.model._meta.label, request.user.pk,
+                     request.get_full_path(), state['count'],
+                     state['latest'])
+
+
+class ConditionalListMixin(object):
+    """Let list views skip serializing when the client's copy is current.
+
+    Only an ETag is sent. A Last-Modified from the latest date_modified
+    would miss deletions, which leave it unchanged.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """Return 304 if the list has not changed since the client's copy."""
+        def etag_func(request, *args, **kwargs):
+            return list_etag(self, request)
+        view = condition(etag_func=etag_func)(
+            super(ConditionalListMixin, self).get)
+        return view(request, *args, **kwargs)
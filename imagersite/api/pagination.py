@@ -0,0 +1,13 @@
+"""Establish pagination styles for Imagersite API."""
+from rest_framework.pagination import CursorPagination
+
+
+class NewestFirstPagination(CursorPagination):
+    """Keyset pagination walking items newest first by primary key.
+
+    Each page filters on id below the last one seen, so deep pages cost
+    the same index range scan as the first.
+    """
+
+    page_size = 50
+    ordering = '-id'
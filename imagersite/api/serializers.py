@@ -1,24 +1,70 @@
 """Serializers to convert models into JSON."""
 
+from django.db import models
 from rest_framework import serializers
 from imager_images.models import Photo, Album
+from imager_images.thumbnails import attach_srcsets
 
 
-class PhotoSerializer(serializers.HyperlinkedModelSerializer):
+class SparseFieldsMixin(object):
+    """Limit serialized fields to those named in a fields= query param."""
+
+    def __init__(self, *args, **kwargs):
+        """Drop every field the request did not ask for."""
+        super(SparseFieldsMixin, self).__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or not request.query_params.get('fields'):
+            return
+        requested = set(request.query_params['fields'].split(','))
+        for name in set(self.fields) - requested:
+            self.fields.pop(name)
+
+
+class PhotoListSerializer(serializers.ListSerializer):
+    """Serialize many Photos, looking up all their renditions at once."""
+
+    def to_representation(self, data):
+        """Attach renditions to every photo before serializing them."""
+        if isinstance(data, models.Manager):
+            data = data.all()
+        if 'renditions' in self.child.fields:
+            data = attach_srcsets(data)
+        return super(PhotoListSerializer, self).to_representation(data)
+
+
+class PhotoSerializer(SparseFieldsMixin,
+                      serializers.HyperlinkedModelSerializer):
     """Serializer for the Photo model."""
 
     owner = serializers.ReadOnlyField(source='owner.username')
     img_file = serializers.FileField(use_url=True)
+    renditions = serializers.SerializerMethodField()
 
     class Meta:
         """Meta for PhotoSerializer."""
 
         model = Photo
-        fields = ['owner', 'img_file', 'title', 'description',
+        fields = ['owner', 'img_file', 'width', 'height', 'file_size',
+                  'img_format', 'renditions', 'title', 'description',
                   'published']
+        list_serializer_class = PhotoListSerializer
+
+    def get_renditions(self, obj):
+        """Return list of url and width of each rendition, narrowest first."""
+        if not hasattr(obj, 'renditions'):
+            attach_srcsets([obj])
+        request = self.context.get('request')
+        results = []
+        for width, img_file in obj.renditions:
+            url = img_file.url
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            results.append({'width': width, 'url': url})
+        return results
 
 
-class AlbumSerializer(serializers.HyperlinkedModelSerializer):
+class AlbumSerializer(SparseFieldsMixin,
+                      serializers.HyperlinkedModelSerializer):
     """Serializer for the Album model."""
 
     owner = serializers.ReadOnlyField(source='owner.username')
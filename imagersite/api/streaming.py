@@ -0,0 +1,70 @@
+"""Stream whole API lists as JSON without holding them in memory."""
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+CHUNK_SIZE = 500
+FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """Generate lists of objects from queryset, chunk_size at a time.
+
+    Chunks are fetched by primary key range rather than one big cursor,
+    so neither the database driver nor Python holds the whole result.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def stream_json(serializer, queryset, fmt='json'):
+    """Generate serialized text of queryset piece by piece.
+
+    Serializer is a list serializer, given one chunk of objects at a
+    time. The json format yields one JSON array, ndjson one object per
+    line.
+    """
+    encoder = JSONEncoder()
+    if fmt == 'ndjson':
+        start, separator, end = '', '\n', '\n'
+    else:
+        start, separator, end = '[', ',', ']'
+    yield start
+    first = True
+    for chunk in iter_chunks(queryset):
+        text = separator.join(
+            encoder.encode(item)
+            for item in serializer.to_representation(chunk))
+        yield text if first else separator + text
+        first = False
+    if fmt == 'json' or not first:
+        yield end
+
+
+class StreamingListMixin(object):
+    """Let list views stream the whole list when ?stream= is given."""
+
+    stream_query_param = 'stream'
+
+    def list(self, request, *args, **kwargs):
+        """Stream the unpaginated list as json or ndjson if asked to."""
+        fmt = request.query_params.get(self.stream_query_param)
+        if fmt not in FORMATS:
+            return super(StreamingListMixin, self).list(
+                request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer(many=True)
+        return StreamingHttpResponse(
+            stream_json(serializer, queryset, fmt),
+            content_type=FORMATS[fmt])
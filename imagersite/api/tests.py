@@ -1,3 +1,266 @@
-from django.test import TestCase
+"""Test the Imagersite REST API views."""
+from __future__ import unicode_literals
+from django.test import Client, TestCase, override_settings
+from imager_images.models import Photo
+from imager_images.thumbnails import generate_srcset, render
+from django.contrib.auth.models import Permission
+from django.core.files.uploadedfile import SimpleUploadedFile
+from imager_images.tests import (
+    TMP_MEDIA_ROOT,
+    AlbumFactory,
+    PhotoFactory,
+    make_upload,
+)
+from imager_images.gallery import bump_gallery_version
+from imager_profile.tests import UserFactory
+from .pagination import NewestFirstPagination
+from .streaming import iter_chunks
+import json
 
-# Create your tests here.
+PHOTOS = '/api/v1/photos/'
+ALBUMS = '/api/v1/albums/'
+UPLOAD = '/api/v1/photos/upload/'
+GALLERY = '/api/v1/gallery/'
+PAGE_SIZE = NewestFirstPagination.page_size
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class ApiListCase(TestCase):
+    """Test paging, field selection and streaming of the API lists."""
+
+    def setUp(self):
+        """Log in a user owning more photos than fit on one page."""
+        self.user = UserFactory.create(username='ApiUser')
+        self.photo_batch = PhotoFactory.create_batch(
+            PAGE_SIZE + 1, owner=self.user)
+        self.album_batch = AlbumFactory.create_batch(2, owner=self.user)
+        PhotoFactory.create(owner=UserFactory.create(username='OtherUser'))
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def get_all_pages(self, url):
+        """Follow next links from url, returning list of every result."""
+        results = []
+        while url:
+            page = self.client.get(url).json()
+            results.extend(page['results'])
+            url = page['next']
+        return results
+
+    def test_anonymous_forbidden(self):
+        """Test that the API lists require a logged in user."""
+        response = Client().get(PHOTOS)
+        self.assertEqual(response.status_code, 403)
+
+    def test_first_page_size(self):
+        """Test that the first page holds one page of newest photos."""
+        page = self.client.get(PHOTOS).json()
+        self.assertEqual(len(page['results']), PAGE_SIZE)
+        self.assertTrue(page['next'])
+
+    def test_pages_cover_owned_photos(self):
+        """Test that following the cursor yields every owned photo once."""
+        results = self.get_all_pages(PHOTOS)
+        titles = [photo['title'] for photo in results]
+        self.assertEqual(sorted(titles),
+                         sorted(photo.title for photo in self.photo_batch))
+
+    def test_album_list(self):
+        """Test that the album list pages the user's albums."""
+        results = self.get_all_pages(ALBUMS)
+        self.assertEqual(len(results), len(self.album_batch))
+
+    def test_sparse_fields(self):
+        """Test that fields= limits each result to the named fields."""
+        page = self.client.get(PHOTOS, {'fields': 'title,published'}).json()
+        for photo in page['results']:
+            self.assertEqual(set(photo), {'title', 'published'})
+
+    def test_all_fields_default(self):
+        """Test that every serializer field is sent without fields=."""
+        page = self.client.get(ALBUMS).json()
+        for album in page['results']:
+            self.assertIn('owner', album)
+            self.assertIn('title', album)
+
+    def get_stream(self, url, fmt, **params):
+        """Return decoded body of the streamed list at url in format fmt."""
+        params['stream'] = fmt
+        response = self.client.get(url, params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_stream_json(self):
+        """Test that stream=json sends every owned photo in one array."""
+        results = json.loads(self.get_stream(PHOTOS, 'json'))
+        self.assertEqual(len(results), len(self.photo_batch))
+
+    def test_stream_ndjson(self):
+        """Test that stream=ndjson sends one owned album per line."""
+        lines = self.get_stream(ALBUMS, 'ndjson').splitlines()
+        self.assertEqual(len(lines), len(self.album_batch))
+        for line in lines:
+            self.assertIn('title', json.loads(line))
+
+    def test_stream_sparse_fields(self):
+        """Test that streamed results honour fields= as well."""
+        results = json.loads(self.get_stream(PHOTOS, 'json', fields='title'))
+        for photo in results:
+            self.assertEqual(set(photo), {'title'})
+
+    def test_not_modified(self):
+        """Test that an unchanged list is answered with 304."""
+        etag = self.client.get(PHOTOS)['ETag']
+        response = self.client.get(PHOTOS, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_delete_changes_etag(self):
+        """Test that deleting a listed photo makes the old ETag stale."""
+        etag = self.client.get(PHOTOS)['ETag']
+        self.photo_batch[0].delete()
+        response = self.client.get(PHOTOS, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_renditions_change_etag(self):
+        """Test that finishing a listed photo's renditions changes the ETag."""
+        etag = self.client.get(PHOTOS)['ETag']
+        render(self.photo_batch[0].img_file)
+        response = self.client.get(PHOTOS, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_per_page(self):
+        """Test that each page of a list has its own ETag."""
+        first = self.client.get(PHOTOS)
+        second = self.client.get(first.json()['next'])
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_owner_param(self):
+        """Test that ?owner= lists only that user's visible items."""
+        friend = UserFactory.create(username='ApiFriend')
+        self.user.profile.add_friend(friend)
+        shared = PhotoFactory.create(owner=friend, published='shared')
+        PhotoFactory.create(owner=friend, published='private')
+        results = self.get_all_pages(PHOTOS + '?owner={}'.format(friend.pk))
+        self.assertEqual([photo['title'] for photo in results],
+                         [shared.title])
+
+    def test_owner_param_invalid(self):
+        """Test that a non numeric ?owner= is refused."""
+        response = self.client.get(PHOTOS, {'owner': 'me'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_iter_chunks(self):
+        """Test that chunks cover the queryset once, in pk order."""
+        queryset = Photo.objects.filter(owner=self.user)
+        chunks = list(iter_chunks(queryset, chunk_size=PAGE_SIZE // 2))
+        self.assertEqual(len(chunks), 3)
+        pks = [photo.pk for chunk in chunks for photo in chunk]
+        self.assertEqual(pks, sorted(p.pk for p in self.photo_batch))
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT, IMAGER_GALLERY_PAGE_SIZE=2)
+class ApiGalleryCase(TestCase):
+    """Test browsing public photos through the API."""
+
+    def setUp(self):
+        """Add three public photos and a private one."""
+        bump_gallery_version()
+        owner = UserFactory.create(username='GalleryOwner')
+        self.photo_batch = PhotoFactory.create_batch(
+            3, owner=owner, published='public')
+        PhotoFactory.create(owner=owner, published='private')
+
+    def test_anonymous_pages(self):
+        """Test that anyone can page through the public photos."""
+        titles = []
+        url = GALLERY
+        while url:
+            page = Client().get(url).json()
+            titles.extend(photo['title'] for photo in page['results'])
+            url = page['next']
+        self.assertEqual(titles,
+                         [photo.title for photo in self.photo_batch[::-1]])
+
+    def test_cached(self):
+        """Test that a repeated first page is answered unqueried."""
+        Client().get(GALLERY)
+        with self.assertNumQueries(0):
+            page = Client().get(GALLERY).json()
+        self.assertEqual(len(page['results']), 2)
+
+    def test_next_keeps_fields(self):
+        """Test that the next page link asks for the same fields."""
+        page = Client().get(GALLERY, {'fields': 'title'}).json()
+        page = Client().get(page['next']).json()
+        self.assertEqual([set(photo) for photo in page['results']],
+                         [{'title'}])
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is refused."""
+        response = Client().get(GALLERY, {'page': '0'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class ApiUploadCase(TestCase):
+    """Test uploading many images at once through the API."""
+
+    def setUp(self):
+        """Log in a user allowed to add photos."""
+        self.user = UserFactory.create(username='ApiUploader')
+        perm = Permission.objects.get(codename='add_photo')
+        self.user.user_permissions.add(perm)
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_upload_needs_permission(self):
+        """Test that users without add_photo permission cannot upload."""
+        client = Client()
+        client.force_login(UserFactory.create(username='NoPerms'))
+        response = client.post(UPLOAD, {'files': [make_upload('a.jpg')],
+                                        'published': 'private'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_upload_creates_photos(self):
+        """Test that each uploaded image is created and returned."""
+        uploads = [make_upload('a.jpg'), make_upload('b.png', 'red', 'PNG')]
+        response = self.client.post(UPLOAD, {'files': uploads,
+                                             'published': 'shared'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), len(uploads))
+        self.assertEqual(self.user.photos.filter(published='shared').count(),
+                         len(uploads))
+
+    def test_upload_records_metadata(self):
+        """Test that uploaded photos are returned with their metadata."""
+        response = self.client.post(UPLOAD, {
+            'files': [make_upload('b.png', 'red', 'PNG')],
+            'published': 'private'})
+        photo = response.json()[0]
+        self.assertEqual((photo['width'], photo['height']), (40, 30))
+        self.assertEqual(photo['img_format'], 'PNG')
+        self.assertTrue(self.user.photos.get().content_hash)
+
+    def test_upload_renditions(self):
+        """Test that renditions are listed once made, never in the upload."""
+        response = self.client.post(UPLOAD, {
+            'files': [make_upload('w.jpg', 'maroon', size=(700, 500))],
+            'published': 'private'})
+        renditions = response.json()[0]['renditions']
+        self.assertEqual([item['width'] for item in renditions], [700])
+        photo = self.user.photos.get()
+        generate_srcset(photo.img_file, photo.width)
+        renditions = self.client.get(PHOTOS).json()['results'][0][
+            'renditions']
+        self.assertEqual([item['width'] for item in renditions],
+                         [320, 640, 700])
+        self.assertTrue(renditions[0]['url'].startswith('http'))
+
+    def test_upload_invalid(self):
+        """Test that a non image upload is refused with its name."""
+        response = self.client.post(UPLOAD, {
+            'files': [SimpleUploadedFile('bad.jpg', b'no')],
+            'published': 'private'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('bad.jpg', response.json()['files'][0])
+        self.assertFalse(self.user.photos.count())
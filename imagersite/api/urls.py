@@ -5,7 +5,11 @@ from api import views
 
 urlpatterns = [
     url(r'^photos/$', views.PhotoListView.as_view(), name='photos'),
+    url(r'^photos/upload/$',
+        views.PhotoUploadView.as_view(),
+        name='upload_photos'),
     url(r'^albums/$', views.AlbumListView.as_view(), name='albums'),
+    url(r'^gallery/$', views.GalleryView.as_view(), name='gallery'),
     # url(r'^albums/(?P<pk>[0-9]+)/$',
     #     views.AlbumPhotoListView.as_view(),
     #     'album-photo-list'),
@@ -1,41 +1,126 @@
 """Establish views for API access."""
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from .conditional import ConditionalListMixin
+from .pagination import NewestFirstPagination
 from .permissions import IsOwnerAndReadOnly
+from .streaming import StreamingListMixin
 from api.serializers import PhotoSerializer, AlbumSerializer
+from imager_images.forms import BulkPhotoForm
+from imager_images.gallery import cached_page, parse_cursor
 from imager_images.models import Photo, Album
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import (
+    AllowAny,
+    IsAuthenticated,
+    DjangoModelPermissions,
+)
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 
-class PhotoListView(ListAPIView):
-    """View allowing API access to view lists of owner's photos."""
+class VisibleListMixin(object):
+    """List the logged in user's items, or those of ?owner= they may see."""
 
-    queryset = Photo.objects.all()
+    def get_queryset(self, *args, **kwargs):
+        """Filter list to the owner's items visible to the logged in user."""
+        queryset = super(VisibleListMixin, self).get_queryset(*args, **kwargs)
+        owner = self.request.query_params.get('owner')
+        if owner is None:
+            return queryset.filter(owner=self.request.user)
+        if not owner.isdigit():
+            raise ValidationError({'owner': 'Must be a user id.'})
+        return queryset.visible_to(self.request.user).filter(owner_id=owner)
+
+
+class PhotoListView(VisibleListMixin, ConditionalListMixin,
+                    StreamingListMixin, ListAPIView):
+    """View allowing API access to view lists of visible photos."""
+
+    queryset = Photo.objects.select_related('owner')
     serializer_class = PhotoSerializer
+    pagination_class = NewestFirstPagination
     permission_classes = (
         IsAuthenticated,
         IsOwnerAndReadOnly,
     )
 
-    def list(self, request, *args, **kwargs):
-        """Filter list to only those belonging to the logged in user."""
-        self.queryset = self.queryset.filter(owner=request.user)
-        return super(PhotoListView, self).list(request, *args, **kwargs)
-
 
-class AlbumListView(ListAPIView):
-    """View allowing API access to view lists of owner's albums."""
+class AlbumListView(VisibleListMixin, ConditionalListMixin,
+                    StreamingListMixin, ListAPIView):
+    """View allowing API access to view lists of visible albums."""
 
-    queryset = Album.objects.all()
+    queryset = Album.objects.select_related('owner')
     serializer_class = AlbumSerializer
+    pagination_class = NewestFirstPagination
     permission_classes = (
         IsAuthenticated,
         IsOwnerAndReadOnly,
     )
 
-    def get_queryset(self, *args, **kwargs):
-        """Filter list to only those belonging to the logged in user."""
-        queryset = super(AlbumListView, self).get_queryset(*args, **kwargs)
-        return queryset.filter(owner=self.request.user)
+
+class GalleryView(APIView):
+    """View allowing anyone API access to public photos, newest first.
+
+    Pages are found by a before= cursor of the date_published and id of
+    the photo the previous one ended at, written <date_published>-<id>.
+    The first of them are serialized once and then served from the cache.
+    """
+
+    permission_classes = (AllowAny,)
+
+    def get(self, request, *args, **kwargs):
+        """Return a page of public photos and the url of the next."""
+        try:
+            page, before = parse_cursor(request.query_params)
+        except ValueError:
+            raise ValidationError({'before': 'Invalid gallery cursor.'})
+
+        def render(photos):
+            return list(PhotoSerializer(
+                photos, many=True, context={'request': request}).data)
+
+        fields = ','.join(sorted(PhotoSerializer(
+            context={'request': request}).fields))
+        name = 'api:{}:{}'.format(request.get_host(), fields)
+        results, next_before = cached_page(name, page, before, render)
+        next_url = None
+        if next_before is not None:
+            params = request.query_params.copy()
+            params['page'] = page + 1
+            params['before'] = next_before
+            next_url = request.build_absolute_uri('?' + params.urlencode())
+        return Response({'next': next_url, 'results': results})
+
+
+class PhotoUploadView(APIView):
+    """View allowing API upload of many image files as new photos."""
+
+    queryset = Photo.objects.none()
+    parser_classes = (MultiPartParser,)
+    permission_classes = (
+        IsAuthenticated,
+        DjangoModelPermissions,
+    )
+
+    def initialize_request(self, request, *args, **kwargs):
+        """Spool uploads straight to temporary files on disk."""
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return super(PhotoUploadView, self).initialize_request(
+            request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        """Create a photo owned by the logged in user for each file."""
+        form = BulkPhotoForm(request.POST, request.FILES)
+        form.fields['albums'].queryset = request.user.albums.all()
+        if not form.is_valid():
+            return Response(form.errors, status=status.HTTP_400_BAD_REQUEST)
+        photos = form.save(request.user)
+        serializer = PhotoSerializer(
+            photos, many=True, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
 # class AlbumPhotoListView(PhotoListView):
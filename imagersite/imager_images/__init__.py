@@ -0,0 +1,3 @@
+"""Initialize imager_images package and config."""
+
+default_app_config = 'imager_images.apps.ImagerImagesConfig'
@@ -6,3 +6,7 @@ class ImagerImagesConfig(AppConfig):
     """Set up Config for the imager_images app."""
 
     name = 'imager_images'
+
+    def ready(self):
+        """Run code when the app is ready."""
+        from imager_images import handlers
@@ -0,0 +1,181 @@
+"""Timelines of what each user's friends have shared.
+
+When a photo or album leaves private, an entry is written to the
+timeline of each of the owner's friends, so reading a feed is one range
+query over the (user, date) index. Entries between two users are
+deleted when they stop being friends, and every entry read is checked
+against the visibility of its item once more. Owners with more than
+IMAGER_FEED_FANOUT_LIMIT friends are not fanned out. Their items are
+merged into their friends' feeds when those are read instead. Both
+sides tell them apart by the friend_count kept on their profiles, and
+owners falling back under the limit have their recent items back-filled.
+"""
+from operator import attrgetter
+from django.conf import settings
+from django.db.models import Count, Q
+from imager_profile.friends import friend_user_ids
+from imager_profile.models import ImagerProfile
+from .models import Photo, Album, FeedEntry
+
+FEED_LENGTH = 200
+PAGE_SIZE = 50
+VISIBLE = ('shared', 'public')
+
+
+def fanout_limit():
+    """Return the most friends an owner may have to be fanned out."""
+    return getattr(settings, 'IMAGER_FEED_FANOUT_LIMIT', 1000)
+
+
+def over_limit(owner_ids):
+    """Return set of the owners in owner_ids with too many friends to push."""
+    return set(ImagerProfile.objects.filter(
+        user_id__in=owner_ids, friend_count__gt=fanout_limit()).values_list(
+            'user_id', flat=True))
+
+
+def _item_fields(item):
+    """Return dict of the FeedEntry fields pointing at photo or album."""
+    if isinstance(item, Photo):
+        return {'photo': item}
+    return {'album': item}
+
+
+def fan_out(item):
+    """Add a newly shared item to the feed of each of its owner's friends.
+
+    Return the number of entries written, none for owners over the limit.
+    """
+    return fan_out_many([item])
+
+
+def fan_out_many(items):
+    """Add newly shared items to the feeds of their owners' friends.
+
+    The entries of every item are written in one insert. Return their
+    number, leaving out items of owners over the limit.
+    """
+    items = list(items)
+    pulled = over_limit({item.owner_id for item in items})
+    entries = []
+    for item in items:
+        if item.owner_id in pulled:
+            continue
+        recipients = friend_user_ids(item.owner_id)
+        entries.extend(
+            FeedEntry(user_id=user_id, actor_id=item.owner_id,
+                      date=item.date_published, **_item_fields(item))
+            for user_id in recipients)
+    FeedEntry.objects.bulk_create(entries)
+    return len(entries)
+
+
+def withdraw(item):
+    """Remove an item made private again from every feed."""
+    FeedEntry.objects.filter(**_item_fields(item)).delete()
+
+
+def unfriend(user_id, other_ids=None):
+    """Delete entries between user_id and the users in other_ids.
+
+    Without other_ids every entry to or from user_id is deleted, as
+    after the user's friends are cleared.
+    """
+    if other_ids is None:
+        between = Q(user_id=user_id) | Q(actor_id=user_id)
+    else:
+        between = (Q(user_id=user_id, actor_id__in=other_ids) |
+                   Q(user_id__in=other_ids, actor_id=user_id))
+    FeedEntry.objects.filter(between).delete()
+
+
+def back_under_limit(owner_ids):
+    """Return set of the owners in owner_ids with at most limit friends.
+
+    They are counted from the friendship rows, which are already changed
+    while profile friend counts may not be yet.
+    """
+    return set(ImagerProfile.objects.filter(user_id__in=owner_ids).annotate(
+        friends_now=Count('friends')).filter(
+            friends_now__lte=fanout_limit()).values_list('user_id', flat=True))
+
+
+def backfill(owner_ids):
+    """Push recent items of owners back under the limit to their friends.
+
+    Items shared while an owner had too many friends were only merged in
+    when feeds were read, so without entries they would drop out of the
+    feeds. Entries already there are kept. Return the number written.
+    """
+    entries = []
+    for owner_id in owner_ids:
+        recipients = set(ImagerProfile.objects.filter(
+            friends__user_id=owner_id).values_list('user_id', flat=True))
+        existing = set(FeedEntry.objects.filter(actor_id=owner_id).values_list(
+            'user_id', 'photo_id', 'album_id'))
+        for model in (Photo, Album):
+            items = model.objects.filter(
+                owner_id=owner_id, published__in=VISIBLE,
+                date_published__isnull=False).order_by(
+                    '-date_published')[:FEED_LENGTH]
+            for item in items:
+                ids = (item.pk, None) if model is Photo else (None, item.pk)
+                entries.extend(
+                    FeedEntry(user_id=user_id, actor_id=owner_id,
+                              date=item.date_published, **_item_fields(item))
+                    for user_id in recipients
+                    if (user_id,) + ids not in existing)
+    FeedEntry.objects.bulk_create(entries)
+    return len(entries)
+
+
+def _pulled_entries(user, limit):
+    """Return list of unsaved entries of friends who were not fanned out.
+
+    Newest first, from the shared items of the user's friends with more
+    friends than the fan out limit.
+    """
+    owners = over_limit(friend_user_ids(user.pk))
+    if not owners:
+        return []
+    entries = []
+    for model, related in ((Photo, ['owner']), (Album, ['owner', 'cover'])):
+        items = model.objects.filter(
+            owner_id__in=owners, published__in=VISIBLE,
+            date_published__isnull=False).select_related(
+                *related).order_by('-date_published')[:limit]
+        entries.extend(FeedEntry(user=user, actor=item.owner,
+                                 date=item.date_published,
+                                 **_item_fields(item))
+                       for item in items)
+    return sorted(entries, key=attrgetter('date'), reverse=True)
+
+
+def read_feed(user, limit=PAGE_SIZE):
+    """Return list of the newest entries in the user's feed, newest first.
+
+    Entries whose item the user may no longer see are left out, which
+    covers items made private by bulk updates that sent no signals.
+    Items both pushed and merged in, from owners who went over the limit
+    after sharing them, are listed once.
+    """
+    pushed = FeedEntry.objects.filter(user=user).select_related(
+        'actor', 'photo', 'album__cover').order_by('-date')[:limit]
+    entries = [entry for entry in pushed if entry.item.is_visible_to(user)]
+    pulled = _pulled_entries(user, limit)
+    if not pulled:
+        return entries
+    merged, seen = [], set()
+    for entry in sorted(entries + pulled, key=attrgetter('date'),
+                        reverse=True):
+        if (entry.photo_id, entry.album_id) not in seen:
+            seen.add((entry.photo_id, entry.album_id))
+            merged.append(entry)
+    return merged[:limit]
+
+
+def entry_img_file(entry):
+    """Return the image shown for a feed entry."""
+    if entry.photo_id:
+        return entry.photo.img_file
+    return entry.album.get_cover()
@@ -1,7 +1,8 @@
 """Forms for adding, editing and deleting Albums and Photos."""
 
 from django import forms
-from .models import Photo, Album
+from .models import Photo, Album, PUB_CHOICES, PUB_DEFAULT
+from .uploads import inspect_images, create_photos
 
 
 class AlbumForm(forms.ModelForm):
@@ -23,5 +24,40 @@ class AlbumForm(forms.ModelForm):
         """Extend ModelForm save method ensuring we add photos to album."""
         photos = self.cleaned_data['photos']
         instance = super(AlbumForm, self).save(commit)
-        instance.photos.add(*photos)
+        instance.add_photos(photos)
         return instance
+
+
+class BulkPhotoForm(forms.Form):
+    """Form for uploading many image files as new Photos at once."""
+
+    files = forms.FileField(
+        label='Images',
+        widget=forms.ClearableFileInput(attrs={'multiple': True}))
+    published = forms.ChoiceField(
+        choices=[(choice, choice) for choice in PUB_CHOICES],
+        initial=PUB_DEFAULT)
+    albums = forms.ModelMultipleChoiceField(
+        label='Albums',
+        required=False,
+        queryset=Album.objects.all()
+    )
+
+    def clean_files(self):
+        """Return list of every upload and its metadata, if all are images."""
+        uploads = self.files.getlist(self.add_prefix('files'))
+        inspected = list(zip(uploads, inspect_images(uploads)))
+        invalid = [upload.name for upload, metadata in inspected
+                   if metadata is None]
+        if invalid:
+            raise forms.ValidationError(
+                'These files are not valid images: {}.'.format(
+                    ', '.join(invalid)))
+        return inspected
+
+    def save(self, owner):
+        """Create a Photo owned by owner for each uploaded image."""
+        return create_photos(owner,
+                             self.cleaned_data['files'],
+                             self.cleaned_data['published'],
+                             self.cleaned_data['albums'])
@@ -0,0 +1,154 @@
+"""Pages of the public gallery, the first of which are kept rendered.
+
+Pages are read newest published first with keyset pagination, each one
+ranging over the (published, date_published, id) index from the last
+photo of the page before. The first IMAGER_GALLERY_CACHED_PAGES pages
+are cached once rendered, under a version number that is bumped
+whenever a photo enters, leaves or changes in the gallery. Bumping
+orphans every cached page at once. Other processes may keep reading
+the old version for as long as the cache's local tier holds it.
+"""
+from datetime import datetime
+import time
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+TIMEOUT = getattr(settings, 'IMAGER_GALLERY_CACHE_TIMEOUT', 300)
+VERSION_KEY = 'gallery:version'
+PAGE_KEY = 'gallery:{}:{}:{}:{}'
+CURSOR_KEY = 'gallery:cursor:{}:{}'
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def page_size():
+    """Return how many photos are shown on each page."""
+    return getattr(settings, 'IMAGER_GALLERY_PAGE_SIZE', 30)
+
+
+def cached_pages():
+    """Return how many pages from the start are kept rendered."""
+    return getattr(settings, 'IMAGER_GALLERY_CACHED_PAGES', 5)
+
+
+def gallery_version():
+    """Return the current version of the cached gallery pages."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = int(time.time())
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def _bump():
+    """Increment the version, restarting a lost one from the clock."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time()), None)
+
+
+def bump_gallery_version():
+    """Make every cached gallery page stale.
+
+    The version is bumped at once and again when the transaction
+    commits, since a request running alongside it may cache a page read
+    before the commit under the first bump. A lost version is restarted
+    from the clock, so pages cached under an earlier one are not picked
+    up again.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def make_cursor(photo):
+    """Return the cursor of the page after the given photo."""
+    stamp = photo.date_published.astimezone(timezone.utc)
+    return '{}-{}'.format(stamp.strftime(CURSOR_FORMAT), photo.pk)
+
+
+def split_cursor(cursor):
+    """Return tuple of the date_published and id a cursor was made from.
+
+    Raise ValueError if it is not a cursor.
+    """
+    stamp, pk = cursor.split('-')
+    date = datetime.strptime(stamp, CURSOR_FORMAT).replace(
+        tzinfo=timezone.utc)
+    return date, int(pk)
+
+
+def parse_cursor(params):
+    """Return tuple of page number and before cursor from query params.
+
+    Raise ValueError if the page is not a positive whole number or the
+    cursor is malformed.
+    """
+    page = int(params.get('page', 1))
+    before = params.get('before')
+    if before is not None:
+        split_cursor(before)
+    if page < 1:
+        raise ValueError('Invalid gallery page.')
+    return page, before
+
+
+def read_page(before=None, size=None):
+    """Return list of public photos published before cursor, and the next.
+
+    The next cursor is None on the last page. Photos not stamped with a
+    date_published yet are left out.
+    """
+    size = size or page_size()
+    photo_model = apps.get_model('imager_images', 'Photo')
+    photos = photo_model.public.filter(
+        date_published__isnull=False).select_related('owner').order_by(
+            '-date_published', '-id')
+    if before is not None:
+        date, pk = split_cursor(before)
+        photos = photos.filter(Q(date_published__lt=date) |
+                               Q(date_published=date, id__lt=pk))
+    photos = list(photos[:size + 1])
+    if len(photos) > size:
+        return photos[:size], make_cursor(photos[size - 1])
+    return photos, None
+
+
+def issued_page(version, page, before):
+    """Return whether the cursor was handed out for this page and version.
+
+    Page 1 has no cursor. The cursors of later pages are recorded as
+    the page before them is cached.
+    """
+    if before is None:
+        return page == 1
+    return cache.get(CURSOR_KEY.format(version, before)) == page
+
+
+def cached_page(name, page, before, render):
+    """Return tuple of the rendered page and its next cursor.
+
+    Render is called with the list of photos on the page. Its result
+    is cached under name for pages up to cached_pages(), so it must be
+    picklable and must not depend on who asked for it. Only cursors
+    handed out from cached pages of the current version are cached,
+    so made up ones cannot fill the cache and are read every time.
+    """
+    version = gallery_version()
+    if page > cached_pages() or not issued_page(version, page, before):
+        photos, next_before = read_page(before)
+        return render(photos), next_before
+    key = PAGE_KEY.format(name, version, page, before or '')
+    cached = cache.get(key)
+    if cached is None:
+        photos, next_before = read_page(before)
+        cached = (render(photos), next_before)
+        cache.set(key, cached, TIMEOUT)
+        if next_before is not None:
+            cache.set(CURSOR_KEY.format(version, next_before), page + 1,
+                      TIMEOUT)
+    return cached
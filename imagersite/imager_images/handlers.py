@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Handlers for init, save and delete events on Photo and Album models."""
+from __future__ import unicode_literals
+from functools import partial
+from django.db.models.signals import (
+    m2m_changed,
+    post_init,
+    pre_save,
+    post_save,
+    post_delete,
+)
+from django.db import transaction
+from django.dispatch import receiver
+from imager_profile.models import ImagerProfile
+from .metadata import read_metadata
+from .feed import (
+    back_under_limit,
+    backfill,
+    fan_out,
+    over_limit,
+    unfriend,
+    withdraw,
+)
+from .gallery import bump_gallery_version
+from .models import Photo, Album, clear_default_cover
+from .storage import release_img_file, unref_img_file
+from .thumbnails import schedule_renditions
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_init, sender=Photo)
+def remember_img_file(sender, **kwargs):
+    """Note the loaded img_file name so a later save can spot a change."""
+    instance = kwargs['instance']
+    instance._loaded_img_file = instance.img_file.name
+
+
+@receiver(post_init, sender=Photo)
+@receiver(post_init, sender=Album)
+def remember_published(sender, **kwargs):
+    """Note the loaded published value so a save can spot it changing.
+
+    A deferred published value is not loaded just for this.
+    """
+    instance = kwargs['instance']
+    instance._loaded_published = instance.__dict__.get('published')
+
+
+@receiver(pre_save, sender=Photo)
+def record_metadata(sender, **kwargs):
+    """Read size, dimensions and hash of a newly uploaded image file."""
+    instance = kwargs['instance']
+    img_file = instance.img_file
+    if kwargs.get('raw') or not img_file or img_file._committed:
+        return
+    try:
+        metadata = read_metadata(img_file.file)
+    except IOError:
+        logger.warn('Unable to read metadata of %s.', img_file.name)
+        return
+    for field, value in metadata.items():
+        setattr(instance, field, value)
+
+
+@receiver(post_save, sender=Photo)
+def release_replaced_img_file(sender, **kwargs):
+    """Delete the image a photo was changed from once nothing uses it."""
+    instance = kwargs['instance']
+    loaded = instance._loaded_img_file
+    if loaded and loaded != instance.img_file.name:
+        unref_img_file(loaded)
+        transaction.on_commit(partial(release_img_file, loaded))
+
+
+@receiver(post_delete, sender=Photo)
+def release_deleted_img_file(sender, **kwargs):
+    """Delete the image of a deleted photo once nothing uses it."""
+    name = kwargs['instance'].img_file.name
+    unref_img_file(name)
+    transaction.on_commit(partial(release_img_file, name))
+
+
+@receiver(post_save, sender=Photo)
+def queue_thumbnails(sender, **kwargs):
+    """Queue thumbnail generation for new photos or replaced images."""
+    instance = kwargs['instance']
+    if kwargs.get('raw') or not instance.img_file:
+        return
+    changed = instance.img_file.name != instance._loaded_img_file
+    if kwargs.get('created') or changed:
+        schedule_renditions(instance.img_file)
+    instance._loaded_img_file = instance.img_file.name
+
+
+@receiver(post_save, sender=Photo)
+def refresh_gallery(sender, **kwargs):
+    """Make cached gallery pages stale when a public photo changes.
+
+    This covers photos turning public or private as well as edits of
+    public ones. It is connected before update_feeds, which moves
+    _loaded_published on to the saved value.
+    """
+    instance = kwargs['instance']
+    if kwargs.get('raw'):
+        return
+    if 'public' in (instance.published, instance._loaded_published):
+        bump_gallery_version()
+
+
+@receiver(post_delete, sender=Photo)
+def drop_from_gallery(sender, **kwargs):
+    """Make cached gallery pages stale when a public photo is deleted."""
+    if kwargs['instance'].published == 'public':
+        bump_gallery_version()
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_save, sender=Album)
+def update_feeds(sender, **kwargs):
+    """Fan out items leaving private and withdraw those going back."""
+    instance = kwargs['instance']
+    if kwargs.get('raw'):
+        return
+    was = 'private' if kwargs.get('created') else instance._loaded_published
+    now = instance.published
+    if was == 'private' and now != 'private':
+        fan_out(instance)
+    elif was not in (None, 'private') and now == 'private':
+        withdraw(instance)
+    instance._loaded_published = now
+
+
+@receiver(m2m_changed, sender=ImagerProfile.friends.through)
+def drop_unfriended_entries(sender, **kwargs):
+    """Delete feed entries between users who are no longer friends."""
+    action, instance = kwargs['action'], kwargs['instance']
+    if action == 'post_remove':
+        unfriend(instance.user_id, ImagerProfile.objects.filter(
+            pk__in=kwargs['pk_set']).values_list('user_id', flat=True))
+    elif action == 'post_clear':
+        unfriend(instance.user_id)
+
+
+@receiver(m2m_changed, sender=ImagerProfile.friends.through)
+def backfill_owners_under_limit(sender, **kwargs):
+    """Back-fill feeds from owners unfriending took back under the limit.
+
+    Who was over the limit is noted before the change, while the friend
+    counts on profiles still match the friendship rows.
+    """
+    action, instance = kwargs['action'], kwargs['instance']
+    if action in ('pre_remove', 'pre_clear'):
+        if action == 'pre_remove':
+            others = ImagerProfile.objects.filter(pk__in=kwargs['pk_set'])
+        else:
+            others = ImagerProfile.objects.filter(friends=instance)
+        owner_ids = set(others.values_list('user_id', flat=True))
+        instance._pulled_owner_ids = over_limit(owner_ids | {instance.user_id})
+    elif action in ('post_remove', 'post_clear'):
+        owner_ids = instance.__dict__.pop('_pulled_owner_ids', None)
+        if owner_ids:
+            backfill(back_under_limit(owner_ids))
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+def forget_default_cover(sender, **kwargs):
+    """Drop the cached default album cover when its Photo changes."""
+    clear_default_cover(kwargs['instance'])
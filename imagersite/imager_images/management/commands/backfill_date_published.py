@@ -0,0 +1,28 @@
+"""Stamp date_published on Photos and Albums saved before it was kept."""
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from imager_images.models import Photo, Album
+
+
+class Command(BaseCommand):
+    """Fill in date_published of shared and public items missing it.
+
+    Their upload or creation date stands in for the unknown publication
+    date. Private items still holding one have it cleared.
+    """
+
+    help = 'Stamp date_published on shared and public photos and albums.'
+
+    def handle(self, *args, **options):
+        """Update every item out of step with its published level."""
+        for model, created in ((Photo, 'date_uploaded'),
+                               (Album, 'date_created')):
+            stamped = model.objects.exclude(published='private').filter(
+                date_published__isnull=True).update(
+                    date_published=F(created))
+            cleared = model.objects.filter(
+                published='private', date_published__isnull=False).update(
+                    date_published=None)
+            self.stdout.write('{}: stamped {}, cleared {}.'.format(
+                model._meta.verbose_name_plural.capitalize(), stamped,
+                cleared))
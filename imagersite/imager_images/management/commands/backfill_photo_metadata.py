@@ -0,0 +1,64 @@
+"""Record dimensions, size and hash of Photos saved before they were kept."""
+from multiprocessing.pool import ThreadPool
+from django.core.management.base import BaseCommand
+from imager_images.metadata import read_metadata
+from imager_images.models import Photo
+from imager_images.uploads import WORKERS
+
+BATCH_SIZE = 200
+
+
+def photo_metadata(photo):
+    """Return tuple of photo's pk and metadata read from storage, or None."""
+    try:
+        with photo.img_file.storage.open(photo.img_file.name) as img_file:
+            return photo.pk, read_metadata(img_file)
+    except (IOError, OSError):
+        return photo.pk, None
+
+
+class Command(BaseCommand):
+    """Fill in metadata of every Photo without a content hash.
+
+    Photos are read in batches ordered by pk and each is updated on its
+    own, so the command can be stopped and run again to carry on.
+    """
+
+    help = 'Record dimensions, size and hash of photos missing them.'
+
+    def add_arguments(self, parser):
+        """Allow the worker count and batch size to be chosen."""
+        parser.add_argument(
+            '--workers', type=int, default=WORKERS or 1,
+            help='Number of worker threads reading image files.')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Number of photos read from the database at a time.')
+
+    def handle(self, *args, **options):
+        """Read metadata of each batch of photos in parallel and store it."""
+        workers = options['workers']
+        pool = ThreadPool(workers) if workers > 1 else None
+        pending = (Photo.objects.filter(content_hash='')
+                   .exclude(img_file='').only('img_file').order_by('pk'))
+        last_pk = 0
+        done = failed = 0
+        while True:
+            batch = list(
+                pending.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            results = (pool.imap_unordered(photo_metadata, batch) if pool
+                       else map(photo_metadata, batch))
+            for pk, metadata in results:
+                if metadata is None:
+                    failed += 1
+                    continue
+                Photo.objects.filter(pk=pk).update(**metadata)
+                done += 1
+        if pool:
+            pool.close()
+            pool.join()
+        self.stdout.write('Recorded metadata of {} photos, {} unreadable.'
+                          ''.format(done, failed))
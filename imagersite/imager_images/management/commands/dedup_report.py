@@ -0,0 +1,82 @@
+"""Report how much space storing images by content saves in media."""
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from imager_images.metadata import hash_file
+from imager_images.uploads import WORKERS
+import os
+
+
+def walk_files(storage, path):
+    """Yield name of every file below path in storage."""
+    dirs, files = storage.listdir(path)
+    for name in files:
+        yield os.path.join(path, name)
+    for name in dirs:
+        for found in walk_files(storage, os.path.join(path, name)):
+            yield found
+
+
+def file_hash(name):
+    """Return tuple of name, content hash and size of a stored file."""
+    with default_storage.open(name) as stored:
+        content_hash, file_size = hash_file(stored)
+    return name, content_hash, file_size
+
+
+def thumbnails_size(name):
+    """Return total bytes of the thumbnails sorl made of stored name."""
+    kvstore = default.kvstore
+    source = ImageFile(name, default_storage)
+    total = 0
+    for key in kvstore._get(source.key, identity='thumbnails') or ():
+        thumbnail = kvstore._get(key)
+        try:
+            total += thumbnail.storage.size(thumbnail.name)
+        except (AttributeError, IOError, OSError):
+            pass
+    return total
+
+
+class Command(BaseCommand):
+    """Hash every stored image and total the bytes duplicates take."""
+
+    help = 'Report space taken by duplicate images and their thumbnails.'
+
+    def add_arguments(self, parser):
+        """Allow the media directory and worker count to be chosen."""
+        parser.add_argument(
+            '--path', default='img_files',
+            help='Directory in media storage to scan.')
+        parser.add_argument(
+            '--workers', type=int, default=WORKERS or 1,
+            help='Number of worker threads hashing files.')
+
+    def handle(self, *args, **options):
+        """Group stored files by content and report what copies cost."""
+        names = list(walk_files(default_storage, options['path']))
+        workers = options['workers']
+        if workers > 1 and names:
+            pool = ThreadPool(workers)
+            results = pool.map(file_hash, names)
+            pool.close()
+            pool.join()
+        else:
+            results = [file_hash(name) for name in names]
+        groups = defaultdict(list)
+        for name, content_hash, file_size in results:
+            groups[content_hash].append((name, file_size))
+        total = sum(file_size for name, content_hash, file_size in results)
+        copies = [copy for group in groups.values() for copy in group[1:]]
+        original_savings = sum(file_size for name, file_size in copies)
+        thumbnail_savings = sum(thumbnails_size(name) for name, _ in copies)
+        self.stdout.write('Scanned {} files of {} bytes.'.format(
+            len(results), total))
+        self.stdout.write('{} distinct images, {} duplicate copies.'.format(
+            len(groups), len(copies)))
+        self.stdout.write(
+            'Storing by content saves {} bytes of originals and {} bytes '
+            'of thumbnails.'.format(original_savings, thumbnail_savings))
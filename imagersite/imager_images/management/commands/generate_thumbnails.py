@@ -0,0 +1,32 @@
+"""Generate the standard thumbnails for Photos already in the database."""
+from multiprocessing.pool import ThreadPool
+from django.core.management.base import BaseCommand
+from imager_images.models import Photo
+from imager_images.thumbnails import WORKERS, render, render_job
+
+
+class Command(BaseCommand):
+    """Backfill thumbnails for every Photo using a pool of workers."""
+
+    help = 'Generate the standard thumbnails for all existing photos.'
+
+    def add_arguments(self, parser):
+        """Allow the number of parallel workers to be chosen."""
+        parser.add_argument(
+            '--workers', type=int, default=WORKERS or 1,
+            help='Number of worker threads generating thumbnails.')
+
+    def handle(self, *args, **options):
+        """Feed every Photo's image to the worker pool."""
+        photos = Photo.objects.exclude(img_file='').only('img_file')
+        img_files = (photo.img_file for photo in photos.iterator())
+        workers = options['workers']
+        if workers > 1:
+            pool = ThreadPool(workers)
+            results = list(pool.imap_unordered(render_job, img_files))
+            pool.close()
+            pool.join()
+        else:
+            results = [render(img_file) for img_file in img_files]
+        self.stdout.write('Generated thumbnails for {} of {} photos.'.format(
+            sum(results), len(results)))
@@ -0,0 +1,31 @@
+"""Cut every feed down to its newest entries."""
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from imager_images.feed import FEED_LENGTH
+from imager_images.models import FeedEntry
+
+
+class Command(BaseCommand):
+    """Delete the oldest entries of feeds longer than the feed length."""
+
+    help = 'Delete feed entries beyond the newest of each user.'
+
+    def add_arguments(self, parser):
+        """Allow the number of entries kept per user to be chosen."""
+        parser.add_argument(
+            '--keep', type=int, default=FEED_LENGTH,
+            help='Number of newest entries kept in each feed.')
+
+    def handle(self, *args, **options):
+        """Find only the feeds over length and trim each one."""
+        keep = options['keep']
+        long_feeds = FeedEntry.objects.order_by().values('user').annotate(
+            entries=Count('pk')).filter(entries__gt=keep)
+        deleted = 0
+        for row in long_feeds:
+            entries = FeedEntry.objects.filter(user_id=row['user'])
+            old = list(entries.order_by('-date', '-pk').values_list(
+                'pk', flat=True)[keep:])
+            deleted += entries.filter(pk__in=old).delete()[0]
+        self.stdout.write('Deleted {} old entries from {} feeds.'.format(
+            deleted, len(long_feeds)))
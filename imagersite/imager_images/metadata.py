@@ -0,0 +1,43 @@
+"""Read the metadata Photos store about their image files."""
+from PIL import Image
+import hashlib
+
+CHUNK_SIZE = 64 * 2 ** 10
+
+
+def hash_file(fileobj):
+    """Return tuple of sha256 hex digest and size in bytes of open file."""
+    digest = hashlib.sha256()
+    file_size = 0
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+        file_size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), file_size
+
+
+def read_metadata(fileobj):
+    """Return dict of Photo metadata fields for an open image file.
+
+    The file is read once to hash and measure it. Only the image header
+    is parsed and pixels are never decoded. Raise IOError if the file is
+    not an image Pillow can read.
+    """
+    content_hash, file_size = hash_file(fileobj)
+    try:
+        image = Image.open(fileobj)
+        width, height = image.size
+        img_format = image.format
+        image.verify()
+    except Exception as error:
+        raise IOError('Not a valid image: {}'.format(error))
+    finally:
+        fileobj.seek(0)
+    return {
+        'width': width,
+        'height': height,
+        'file_size': file_size,
+        'img_format': img_format,
+        'content_hash': content_hash,
+    }
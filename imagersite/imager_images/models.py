@@ -1,16 +1,66 @@
 """Establish Python representations of Photos and Albums database tables."""
+import random
 from django.db import models as md
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import six, timezone
 from django.utils.encoding import python_2_unicode_compatible
+from imager_profile.friends import friend_user_ids
+from .gallery import bump_gallery_version
 
 PUB_CHOICES = ['private', 'shared', 'public']
 PUB_DEFAULT = PUB_CHOICES[0]
 PHOTO_PUB_CHOICES = zip(PUB_CHOICES, PUB_CHOICES)
 ALBUM_PUB_CHOICES = zip(PUB_CHOICES, PUB_CHOICES)
 DATE_FORMAT = '%d %B %Y %I:%M%p'
+DEFAULT_COVER = 'DEFAULT_IMAGE'
+DEFAULT_COVER_ASSET = 'django-magic.jpg'
 
+_default_cover = {}
 
-class PublicManager(md.Manager):
+
+class VisibilityQuerySet(md.QuerySet):
+    """QuerySet of Photos or Albums which can be narrowed to a viewer."""
+
+    def visible_to(self, user):
+        """Return QuerySet of the items the given user may view.
+
+        Shared items are matched against the viewer's cached friend set,
+        so the filter is an IN list rather than a join through friends.
+        """
+        visible = md.Q(published='public')
+        if user.is_authenticated():
+            visible |= md.Q(owner_id=user.pk)
+            friends = friend_user_ids(user.pk)
+            if friends:
+                visible |= md.Q(published='shared', owner_id__in=friends)
+        return self.filter(visible)
+
+    def update(self, **kwargs):
+        """Update every row, keeping date_published in step with published.
+
+        Setting published to private clears date_published. Setting it
+        to shared or public stamps rows that had none, in the same
+        UPDATE. Only literal published values are followed this way.
+        Updating published on Photos makes cached gallery pages stale,
+        since no save signal is sent for the rows.
+        """
+        published = kwargs.get('published')
+        if (isinstance(published, six.string_types) and
+                'date_published' not in kwargs):
+            if published == 'private':
+                kwargs['date_published'] = None
+            else:
+                kwargs['date_published'] = Coalesce(
+                    'date_published',
+                    md.Value(timezone.now(), output_field=md.DateTimeField()))
+        rows = super(VisibilityQuerySet, self).update(**kwargs)
+        if rows and 'published' in kwargs and issubclass(self.model, Photo):
+            bump_gallery_version()
+        return rows
+
+
+class PublicManager(md.Manager.from_queryset(VisibilityQuerySet)):
     """QuerySet of Photos which are published."""
 
     def get_queryset(self):
@@ -19,13 +69,67 @@ class PublicManager(md.Manager):
         return queryset.filter(published='public')
 
     def random(self):
-        """Return a single random public photo."""
+        """Return a single random public photo.
+
+        Probe a random primary key between the lowest and highest public pk
+        and take the first public photo at or after it, wrapping around to
+        the start of the range if the upper photos vanished in the meantime.
+        Each step is an index range lookup, so cost does not grow with the
+        table the way ORDER BY RANDOM() does.
+        """
         queryset = self.get_queryset()
-        return queryset.order_by('?').first()
+        bounds = queryset.aggregate(low=md.Min('pk'), high=md.Max('pk'))
+        if bounds['low'] is None:
+            return None
+        probe = random.randint(bounds['low'], bounds['high'])
+        ordered = queryset.order_by('pk')
+        return (ordered.filter(pk__gte=probe).first() or
+                ordered.filter(pk__lt=probe).first())
+
+
+class VisibilityMixin(object):
+    """Visibility rules shared by Photos and Albums."""
+
+    def is_visible_to(self, user):
+        """Return whether the given user may view this item.
+
+        Public items are visible to all, private ones to the owner only
+        and shared ones to the owner's friends as well. Friendship is
+        looked up in the owner's cached friend set.
+        """
+        if self.published == 'public':
+            return True
+        if not user.is_authenticated():
+            return False
+        if self.owner_id == user.pk:
+            return True
+        return (self.published == 'shared' and
+                user.pk in friend_user_ids(self.owner_id))
+
+    def stamp_published(self):
+        """Set or clear date_published to match the published level.
+
+        It is set when the item leaves private and kept while it stays
+        shared or public. Return whether it changed.
+        """
+        if self.published == 'private':
+            stamp = None
+        else:
+            stamp = self.date_published or timezone.now()
+        changed = stamp != self.date_published
+        self.date_published = stamp
+        return changed
+
+    def save(self, *args, **kwargs):
+        """Save the item with date_published stamped in the same query."""
+        update_fields = kwargs.get('update_fields')
+        if self.stamp_published() and update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'date_published'}
+        super(VisibilityMixin, self).save(*args, **kwargs)
 
 
 @python_2_unicode_compatible
-class Photo(md.Model):
+class Photo(VisibilityMixin, md.Model):
     """Represents a single image in the database."""
 
     owner = md.ForeignKey(
@@ -33,7 +137,13 @@ class Photo(md.Model):
         on_delete=md.CASCADE,
         related_name='photos')
     albums = md.ManyToManyField('Album', related_name='photos', blank=True)
-    img_file = md.ImageField(upload_to='img_files')
+    img_file = md.ImageField(upload_to='img_files', db_index=True)
+    width = md.PositiveIntegerField(null=True, editable=False)
+    height = md.PositiveIntegerField(null=True, editable=False)
+    file_size = md.PositiveIntegerField(null=True, editable=False)
+    img_format = md.CharField(max_length=16, blank=True, editable=False)
+    content_hash = md.CharField(
+        max_length=64, blank=True, db_index=True, editable=False)
     title = md.CharField(max_length=255)
     description = md.TextField()
     date_uploaded = md.DateTimeField(auto_now_add=True)
@@ -44,9 +154,19 @@ class Photo(md.Model):
         choices=PHOTO_PUB_CHOICES,
         default=PUB_DEFAULT,
     )
-    objects = md.Manager()
+    objects = VisibilityQuerySet.as_manager()
     public = PublicManager()
 
+    class Meta:
+        """Index the owner and publication columns hot queries filter on."""
+
+        index_together = [
+            ('owner', 'id'),
+            ('owner', 'published'),
+            ('published', 'id'),
+            ('published', 'date_published', 'id'),
+        ]
+
     def __str__(self):
         """String output of Photo instance."""
         return "{}... ({})".format(self.title[:20], _pub_date(self))
@@ -59,7 +179,7 @@ class Photo(md.Model):
 
 
 @python_2_unicode_compatible
-class Album(md.Model):
+class Album(VisibilityMixin, md.Model):
     """Represents a collection of images in the database."""
 
     owner = md.ForeignKey(
@@ -84,6 +204,16 @@ class Album(md.Model):
         choices=ALBUM_PUB_CHOICES,
         default=PUB_DEFAULT,
     )
+    objects = VisibilityQuerySet.as_manager()
+
+    class Meta:
+        """Index the owner and publication columns hot queries filter on."""
+
+        index_together = [
+            ('owner', 'id'),
+            ('owner', 'published'),
+            ('published', 'date_published'),
+        ]
 
     def __str__(self):
         """String output of Album instance."""
@@ -106,24 +236,130 @@ class Album(md.Model):
         self.cover = photo
         self.save()
 
-    def _owned_photos(self, photos):
-        """Generate only photos owned by the owner of the album."""
-        for photo in photos:
-            if photo.owner == self.owner:
-                yield photo
+    def _owned_photo_ids(self, photos):
+        """Return set of pks of photos owned by the owner of the album.
+
+        Photos may be a QuerySet, Photo instances or primary keys.
+        """
+        if isinstance(photos, md.QuerySet):
+            pks = photos.values('pk')
+        else:
+            pks = [getattr(photo, 'pk', photo) for photo in photos]
+        owned = Photo.objects.filter(pk__in=pks, owner_id=self.owner_id)
+        return set(owned.values_list('pk', flat=True))
 
     def add_photos(self, photos):
-        """Set this album on the relationship to all photos in iterable."""
-        for photo in self._owned_photos(photos):
-            photo.albums.add(self)
-            photo.save()
+        """Add owned photos in iterable to this album in one insert.
+
+        Return set of pks of the photos which were not already in it.
+        """
+        through = Photo.albums.through
+        owned = self._owned_photo_ids(photos)
+        present = through.objects.filter(album_id=self.pk, photo_id__in=owned)
+        added = owned - set(present.values_list('photo_id', flat=True))
+        if added:
+            through.objects.bulk_create(
+                through(album_id=self.pk, photo_id=pk) for pk in added)
+            Photo.objects.filter(pk__in=added).update(
+                date_modified=timezone.now())
+        return added
+
+    def remove_photos(self, photos):
+        """Remove photos in iterable from this album in one delete.
+
+        Return set of pks of the photos which were in it. The cover is
+        unset if it was among them.
+        """
+        through = Photo.albums.through
+        owned = self._owned_photo_ids(photos)
+        present = through.objects.filter(album_id=self.pk, photo_id__in=owned)
+        removed = set(present.values_list('photo_id', flat=True))
+        if removed:
+            present.delete()
+            Photo.objects.filter(pk__in=removed).update(
+                date_modified=timezone.now())
+            if self.cover_id in removed:
+                self.cover = None
+                self.save()
+        return removed
 
     def get_cover(self):
         """Return the user set cover of album or a default image."""
-        if self.cover:
+        if self.cover_id:
             return self.cover.img_file
-        item = Photo.objects.get(img_file='DEFAULT_IMAGE')
-        return item.img_file
+        return default_cover()
+
+
+class StoredFile(md.Model):
+    """Count of Photos referring to one stored image file.
+
+    The row is locked whenever a reference is added or the file may be
+    deleted, so the two cannot interleave.
+    """
+
+    name = md.CharField(max_length=100, unique=True)
+    refs = md.PositiveIntegerField(default=0)
+
+
+class FeedEntry(md.Model):
+    """A photo or album a friend shared, placed in one user's feed."""
+
+    user = md.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=md.CASCADE,
+        related_name='feed_entries',
+    )
+    actor = md.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=md.CASCADE,
+        related_name='+',
+    )
+    photo = md.ForeignKey(
+        'Photo', on_delete=md.CASCADE, related_name='+', null=True)
+    album = md.ForeignKey(
+        'Album', on_delete=md.CASCADE, related_name='+', null=True)
+    date = md.DateTimeField()
+
+    class Meta:
+        """Index each user's timeline by date, for range reads."""
+
+        index_together = [
+            ('user', 'date'),
+        ]
+
+    @property
+    def item(self):
+        """Return the photo or album this entry is about."""
+        return self.photo if self.photo_id else self.album
+
+
+def default_cover():
+    """Return the image used for albums without a cover.
+
+    The Photo stored under DEFAULT_COVER is looked up once per process and
+    kept until clear_default_cover is called. Without such a Photo the
+    DEFAULT_COVER_ASSET file in media storage is used.
+    """
+    try:
+        return _default_cover['img_file']
+    except KeyError:
+        pass
+    photo = Photo.objects.filter(img_file=DEFAULT_COVER).first()
+    if photo:
+        _default_cover['pk'] = photo.pk
+        _default_cover['img_file'] = photo.img_file
+    else:
+        field = Photo._meta.get_field('img_file')
+        _default_cover['img_file'] = field.attr_class(
+            None, field, DEFAULT_COVER_ASSET)
+    return _default_cover['img_file']
+
+
+def clear_default_cover(photo=None):
+    """Forget the cached default cover if photo is or was the default."""
+    if (photo is None or photo.img_file.name == DEFAULT_COVER or
+            photo.pk == _default_cover.get('pk')):
+        _default_cover.clear()
 
 
 def _pub_date(obj):
@@ -0,0 +1,98 @@
+"""Store uploaded images once per distinct content.
+
+HashedStorage names every saved file after the sha256 of its content, so
+uploading the same picture again reuses the file already stored, and the
+thumbnails sorl made for it, instead of writing copies. Photos sharing
+content then share one img_file name. Its file is deleted only once no
+Photo refers to the name any more.
+
+References are counted in a StoredFile row per name. Saving takes the
+row lock before checking whether the file exists, and must run inside
+the transaction saving the Photo, as Model.save and bulk_create do, so
+the lock is kept and the count undone with the Photo's insert. Releasing
+takes the same lock before deleting, so a file is never deleted under a
+Photo about to use it.
+"""
+from django.apps import apps
+from django.db import transaction
+from django.db.transaction import TransactionManagementError
+from django.db.models import F
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from sorl.thumbnail import delete as delete_with_thumbnails
+from .metadata import hash_file
+import os
+
+
+class HashedStorage(FileSystemStorage):
+    """File system storage naming files by the hash of their content."""
+
+    def hashed_name(self, name, content):
+        """Return name for content in the directory of name, by its hash."""
+        content_hash, file_size = hash_file(content)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(os.path.dirname(name), content_hash[:2],
+                            content_hash + extension)
+
+    def save(self, name, content, max_length=None):
+        """Save content unless a file of the same content exists already.
+
+        Return the name of the stored file in either case. Raise
+        TransactionManagementError outside a transaction, where a failed
+        Photo insert would leave the reference counted.
+        """
+        if not transaction.get_connection().in_atomic_block:
+            raise TransactionManagementError(
+                'HashedStorage.save must be called inside transaction.atomic.')
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        with transaction.atomic():
+            stored = lock_stored_file(name)
+            stored.refs = F('refs') + 1
+            stored.save(update_fields=['refs'])
+            if self.exists(name):
+                return name
+            return self._save(name, content)
+
+
+def lock_stored_file(name):
+    """Return the locked StoredFile row of name, creating it if missing.
+
+    A new row starts from the committed Photos using the name, which
+    covers files stored before references were counted.
+    """
+    photo_model = apps.get_model('imager_images', 'Photo')
+    stored_model = apps.get_model('imager_images', 'StoredFile')
+    return stored_model.objects.select_for_update().get_or_create(
+        name=name, defaults={
+            'refs': photo_model.objects.filter(img_file=name).count(),
+        })[0]
+
+
+def unref_img_file(name):
+    """Count one Photo fewer using stored image name."""
+    stored_model = apps.get_model('imager_images', 'StoredFile')
+    stored_model.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1)
+
+
+def release_img_file(name):
+    """Delete stored image name and its thumbnails if no Photo uses it.
+
+    Return whether the file was deleted.
+    """
+    if not name:
+        return False
+    photo_model = apps.get_model('imager_images', 'Photo')
+    with transaction.atomic():
+        stored = lock_stored_file(name)
+        if (stored.refs or
+                photo_model.objects.filter(img_file=name).exists()):
+            return False
+        field = photo_model._meta.get_field('img_file')
+        delete_with_thumbnails(field.attr_class(None, field, name))
+        stored.delete()
+    return True
@@ -1,12 +1,47 @@
 """Test that Photo and Album models work as expected."""
 from __future__ import unicode_literals
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.transaction import TransactionManagementError
 from django.db.models.fields.files import ImageFieldFile
-from django.test import TestCase, override_settings
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.utils import timezone
-from .models import Photo, Album, PUB_CHOICES
+from django.utils.six import BytesIO, StringIO
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+from .feed import read_feed
+from .models import (
+    Photo,
+    Album,
+    FeedEntry,
+    StoredFile,
+    PUB_CHOICES,
+    DEFAULT_COVER,
+    DEFAULT_COVER_ASSET,
+    clear_default_cover,
+)
+from .storage import release_img_file
+from .uploads import create_photos, inspect_images
+from .thumbnails import (
+    RENDITIONS,
+    SRCSET_OPTIONS,
+    attach_srcsets,
+    generate_renditions,
+    generate_srcset,
+    resolve_thumbnails,
+    src_rendition,
+    srcset,
+    thumbnail_file,
+)
+from imager_profile.models import ImagerProfile
 from imager_profile.tests import UserFactory
 import factory
 import random
+import shutil
+import tempfile
 
 PHOTO_BATCH_SIZE = 20
 ALBUM_BATCH_SIZE = 10
@@ -14,8 +49,6 @@ USER_BATCH_SIZE = 5
 TMP_MEDIA_ROOT = '/tmp/media/'
 
 
-# TODO: write tests for publicmanager
-
 class PhotoFactory(factory.django.DjangoModelFactory):
     """Creates Photo models for testing."""
 
@@ -31,6 +64,13 @@ class PhotoFactory(factory.django.DjangoModelFactory):
     img_file = factory.django.ImageField()
 
 
+def make_upload(name, color='blue', img_format='JPEG', size=(40, 30)):
+    """Return an uploaded image file of a solid color image."""
+    stream = BytesIO()
+    Image.new('RGB', size, color).save(stream, img_format)
+    return SimpleUploadedFile(name, stream.getvalue())
+
+
 class AlbumFactory(factory.django.DjangoModelFactory):
     """Creates Album models for testing."""
 
@@ -70,8 +110,9 @@ class OnePhotoOrAlbumCase(object):
         self.assertGreater(timezone.now(), self.instance.date_modified)
 
     def test_instance_pub_date(self):
-        """Check that photo/album date_published initializes as None."""
-        self.assertIsNone(self.instance.date_published)
+        """Check that photo/album date_published is set unless private."""
+        self.assertEqual(self.instance.date_published is None,
+                         self.instance.published == 'private')
 
     def test_instance_published(self):
         """Check that photo/album published is in correct choices set."""
@@ -282,3 +323,682 @@ class ManyPhotosManyAlbumsManyUsersCase(TestCase):
                 other_photo = other_user.photos.first()
                 with self.assertRaises(ValueError):
                     album.set_cover(other_photo)
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class PublicManagerCase(TestCase):
+    """Test the public manager and its random photo sampling."""
+
+    def setUp(self):
+        """Add a mix of public and private Photos to the database."""
+        self.public_batch = PhotoFactory.create_batch(
+            PHOTO_BATCH_SIZE // 2, published='public')
+        self.private_batch = PhotoFactory.create_batch(
+            PHOTO_BATCH_SIZE // 2, published='private')
+
+    def test_public_count(self):
+        """Test that the public manager only counts public photos."""
+        self.assertEqual(Photo.public.count(), len(self.public_batch))
+
+    def test_random_is_public(self):
+        """Test that random only ever returns public photos."""
+        for _ in range(PHOTO_BATCH_SIZE):
+            self.assertIn(Photo.public.random(), self.public_batch)
+
+    def test_random_covers_range(self):
+        """Test that random reaches more than one of the public photos."""
+        picks = set(Photo.public.random() for _ in range(PHOTO_BATCH_SIZE))
+        self.assertGreater(len(picks), 1)
+
+    def test_random_fixed_queries(self):
+        """Test that random costs the same few queries on any table size."""
+        with self.assertNumQueries(2):
+            Photo.public.random()
+
+    def test_random_none_public(self):
+        """Test that random returns None when nothing is public."""
+        Photo.objects.filter(published='public').update(published='private')
+        self.assertIsNone(Photo.public.random())
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class ThumbnailPipelineCase(TestCase):
+    """Test pre-generation of the standard Photo thumbnails."""
+
+    def setUp(self):
+        """Add a few Photos to the database for testing."""
+        self.photo_batch = PhotoFactory.create_batch(USER_BATCH_SIZE)
+
+    def test_generate_all_renditions(self):
+        """Test that every standard rendition is made for a photo."""
+        photo = self.photo_batch[0]
+        renditions = generate_renditions(photo.img_file)
+        self.assertEqual(set(renditions), set(RENDITIONS))
+        for thumbnail in renditions.values():
+            self.assertTrue(thumbnail.exists())
+
+    def test_renditions_match_template_thumbnails(self):
+        """Test that generated renditions are the ones templates look up."""
+        photo = self.photo_batch[0]
+        renditions = generate_renditions(photo.img_file)
+        thumbnail = get_thumbnail(photo.img_file, RENDITIONS['grid'])
+        self.assertEqual(thumbnail.name, renditions['grid'].name)
+
+    def test_resolve_generated(self):
+        """Test that made thumbnails are found without any query."""
+        img_files = [photo.img_file for photo in self.photo_batch]
+        made = [generate_renditions(img_file)['grid'].name
+                for img_file in img_files]
+        with self.assertNumQueries(0):
+            resolved = resolve_thumbnails(img_files)
+        self.assertEqual([thumbnail.name for thumbnail in resolved], made)
+
+    def test_resolve_makes_missing(self):
+        """Test that thumbnails not made yet are made when resolved."""
+        resolved = resolve_thumbnails([self.photo_batch[0].img_file])
+        self.assertTrue(resolved[0].exists())
+
+    def test_resolve_empty_file(self):
+        """Test that an empty img_file resolves to no thumbnail."""
+        self.assertEqual(resolve_thumbnails(['']), [None])
+
+    def test_backfill_command(self):
+        """Test that the backfill command renders every photo."""
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('{0} of {0}'.format(USER_BATCH_SIZE), out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class DefaultCoverCase(TestCase):
+    """Test the cached default cover of albums without a cover photo."""
+
+    def setUp(self):
+        """Add one Album with no cover and reset the cached default."""
+        clear_default_cover()
+        self.album = AlbumFactory.create()
+
+    def test_default_cover_asset(self):
+        """Test that the media asset is used when no default Photo exists."""
+        self.assertEqual(self.album.get_cover().name, DEFAULT_COVER_ASSET)
+
+    def test_default_cover_cached(self):
+        """Test that the default cover is only looked up once."""
+        self.album.get_cover()
+        with self.assertNumQueries(0):
+            self.album.get_cover()
+
+    def test_default_cover_photo(self):
+        """Test that saving the default Photo replaces the cached asset."""
+        self.album.get_cover()
+        Photo.objects.create(owner=self.album.owner, img_file=DEFAULT_COVER)
+        self.assertEqual(self.album.get_cover().name, DEFAULT_COVER)
+
+    def test_default_cover_photo_deleted(self):
+        """Test that deleting the default Photo falls back to the asset."""
+        photo = Photo.objects.create(
+            owner=self.album.owner, img_file=DEFAULT_COVER)
+        self.album.get_cover()
+        photo.delete()
+        self.assertEqual(self.album.get_cover().name, DEFAULT_COVER_ASSET)
+
+
+class IndexCase(TestCase):
+    """Test that the composite indexes hot queries rely on exist."""
+
+    def get_index_columns(self, model):
+        """Return list of column lists for each index on model's table."""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table)
+        return [info['columns'] for info in constraints.values()
+                if info['index']]
+
+    def test_photo_indexes(self):
+        """Test Photo has indexes for owner, paging and public filters."""
+        columns = self.get_index_columns(Photo)
+        self.assertIn(['owner_id', 'id'], columns)
+        self.assertIn(['owner_id', 'published'], columns)
+        self.assertIn(['published', 'id'], columns)
+        self.assertIn(['published', 'date_published', 'id'], columns)
+
+    def test_album_indexes(self):
+        """Test Album has indexes for owner, paging and recency filters."""
+        columns = self.get_index_columns(Album)
+        self.assertIn(['owner_id', 'id'], columns)
+        self.assertIn(['owner_id', 'published'], columns)
+        self.assertIn(['published', 'date_published'], columns)
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class BulkMembershipCase(TestCase):
+    """Test set based adding and removing of photos in an album."""
+
+    def setUp(self):
+        """Add one Album and many Photos of the same owner."""
+        self.album = AlbumFactory.create()
+        self.photo_batch = PhotoFactory.create_batch(
+            PHOTO_BATCH_SIZE, owner=self.album.owner)
+
+    def test_add_fixed_queries(self):
+        """Test that adding a batch of photos costs a fixed few queries."""
+        with self.assertNumQueries(4):
+            self.album.add_photos(self.photo_batch)
+        self.assertEqual(self.album.photos.count(), PHOTO_BATCH_SIZE)
+
+    def test_add_reports_added(self):
+        """Test that add_photos returns pks only of newly added photos."""
+        half = PHOTO_BATCH_SIZE // 2
+        self.album.add_photos(self.photo_batch[:half])
+        added = self.album.add_photos(self.photo_batch)
+        self.assertEqual(added,
+                         set(photo.pk for photo in self.photo_batch[half:]))
+
+    def test_add_queryset(self):
+        """Test that photos can be given as a QuerySet."""
+        self.album.add_photos(Photo.objects.all())
+        self.assertEqual(self.album.photos.count(), PHOTO_BATCH_SIZE)
+
+    def test_add_skips_other_owner(self):
+        """Test that photos of other users are not added."""
+        other = PhotoFactory.create(owner=UserFactory(username='OtherGuy'))
+        self.assertFalse(self.album.add_photos([other]))
+        self.assertNotIn(other, self.album.photos.all())
+
+    def test_remove_photos(self):
+        """Test that removing returns and drops only photos in the album."""
+        self.album.add_photos(self.photo_batch[1:])
+        removed = self.album.remove_photos(self.photo_batch[:2])
+        self.assertEqual(removed, {self.photo_batch[1].pk})
+        self.assertEqual(self.album.photos.count(), PHOTO_BATCH_SIZE - 2)
+
+    def test_remove_cover(self):
+        """Test that removing the cover photo unsets the cover."""
+        self.album.add_photos(self.photo_batch)
+        self.album.set_cover(self.photo_batch[0])
+        self.album.remove_photos(self.photo_batch[:1])
+        self.assertIsNone(Album.objects.get(pk=self.album.pk).cover)
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class PhotoMetadataCase(TestCase):
+    """Test recording of image dimensions, size and hash on Photos."""
+
+    def test_metadata_on_save(self):
+        """Test that a saved photo records metadata of its image file."""
+        photo = PhotoFactory.create(img_file=make_upload('meta.png', 'red',
+                                                         'PNG'))
+        photo = Photo.objects.get(pk=photo.pk)
+        self.assertEqual((photo.width, photo.height), (40, 30))
+        self.assertEqual(photo.img_format, 'PNG')
+        self.assertEqual(photo.file_size, photo.img_file.size)
+        self.assertEqual(len(photo.content_hash), 64)
+
+    def test_same_content_same_hash(self):
+        """Test that identical images get the same hash."""
+        first, second = [PhotoFactory.create(img_file=make_upload(name))
+                         for name in ('one.jpg', 'two.jpg')]
+        self.assertEqual(first.content_hash, second.content_hash)
+
+    def test_unchanged_file_not_read(self):
+        """Test that saving without a new image keeps stored metadata."""
+        photo = PhotoFactory.create()
+        Photo.objects.filter(pk=photo.pk).update(content_hash='kept')
+        photo = Photo.objects.get(pk=photo.pk)
+        photo.title = 'Renamed'
+        photo.save()
+        self.assertEqual(Photo.objects.get(pk=photo.pk).content_hash, 'kept')
+
+    def test_backfill_command(self):
+        """Test that the backfill command fills photos missing metadata."""
+        photo_batch = PhotoFactory.create_batch(USER_BATCH_SIZE)
+        Photo.objects.update(width=None, height=None, file_size=None,
+                             img_format='', content_hash='')
+        out = StringIO()
+        call_command('backfill_photo_metadata', workers=2, batch_size=2,
+                     stdout=out)
+        self.assertIn('{} photos'.format(USER_BATCH_SIZE), out.getvalue())
+        self.assertFalse(Photo.objects.filter(content_hash='').exists())
+        photo = Photo.objects.get(pk=photo_batch[0].pk)
+        self.assertTrue(photo.width and photo.height and photo.file_size)
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class HashedStorageCase(TestCase):
+    """Test storing images once per distinct content."""
+
+    def test_same_content_one_file(self):
+        """Test that photos of the same image share one stored file."""
+        first, second = [PhotoFactory.create(img_file=make_upload(name))
+                         for name in ('one.JPG', 'two.jpg')]
+        self.assertEqual(first.img_file.name, second.img_file.name)
+        self.assertTrue(first.img_file.name.startswith('img_files/'))
+        self.assertTrue(first.img_file.name.endswith(
+            first.content_hash + '.jpg'))
+
+    def test_different_content_different_file(self):
+        """Test that different images are stored under different names."""
+        first = PhotoFactory.create(img_file=make_upload('a.jpg', 'red'))
+        second = PhotoFactory.create(img_file=make_upload('a.jpg', 'green'))
+        self.assertNotEqual(first.img_file.name, second.img_file.name)
+
+    def test_release_keeps_shared_file(self):
+        """Test that a file still used by a photo is not deleted."""
+        first, second = [PhotoFactory.create(img_file=make_upload('c.jpg',
+                                                                  'pink'))
+                         for num in range(2)]
+        first.delete()
+        self.assertFalse(release_img_file(second.img_file.name))
+        self.assertTrue(default_storage.exists(second.img_file.name))
+
+    def test_release_last_reference(self):
+        """Test that the file and thumbnails go with the last photo."""
+        photo = PhotoFactory.create(img_file=make_upload('d.jpg', 'orange'))
+        thumbnail = get_thumbnail(photo.img_file, RENDITIONS['grid'])
+        name = photo.img_file.name
+        photo.delete()
+        self.assertTrue(release_img_file(name))
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(thumbnail.exists())
+
+    def test_references_counted(self):
+        """Test that each photo using a file is counted on its row."""
+        first, second = [PhotoFactory.create(img_file=make_upload('e.jpg',
+                                                                  'navy'))
+                         for num in range(2)]
+        name = first.img_file.name
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 2)
+        first.delete()
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 1)
+
+    def test_release_keeps_pending_reuse(self):
+        """Test that a file reused by a photo not yet saved is kept.
+
+        Storing the upload counts the reference before the Photo row
+        exists, so a release in between no longer deletes the file.
+        """
+        photo = PhotoFactory.create(img_file=make_upload('f.jpg', 'teal'))
+        name = photo.img_file.name
+        photo.delete()
+        self.assertEqual(default_storage.save(
+            'img_files/f.jpg', make_upload('f.jpg', 'teal')), name)
+        self.assertFalse(release_img_file(name))
+        self.assertTrue(default_storage.exists(name))
+
+    def test_dedup_report(self):
+        """Test that the report totals bytes of duplicate copies."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        plain = FileSystemStorage(location=media_root)
+        for name in ('a.jpg', 'b.jpg', 'sub/c.jpg'):
+            plain.save('scan/' + name, ContentFile(b'same bytes'))
+        plain.save('scan/d.jpg', ContentFile(b'other'))
+        out = StringIO()
+        with self.settings(MEDIA_ROOT=media_root):
+            call_command('dedup_report', path='scan', workers=2, stdout=out)
+        self.assertIn('Scanned 4 files of 35 bytes.', out.getvalue())
+        self.assertIn('2 distinct images, 2 duplicate copies.',
+                      out.getvalue())
+        self.assertIn('saves 20 bytes of originals', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class HashedStorageCommitCase(TransactionTestCase):
+    """Test that stored files are counted only inside transactions."""
+
+    def test_save_outside_transaction_refused(self):
+        """Test that storing outside a transaction raises, counting nothing."""
+        with self.assertRaises(TransactionManagementError):
+            default_storage.save('img_files/g.jpg', make_upload('g.jpg'))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_photo_save_counted(self):
+        """Test that Model.save stores and counts the file in its own."""
+        photo = PhotoFactory.create(img_file=make_upload('h.jpg', 'olive'))
+        self.assertEqual(
+            StoredFile.objects.get(name=photo.img_file.name).refs, 1)
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class SrcsetCase(TestCase):
+    """Test the ladder of widths offered to browsers for each photo."""
+
+    def setUp(self):
+        """Add a photo wider than the two narrowest srcset widths."""
+        self.photo = PhotoFactory.create(
+            img_file=make_upload('wide.jpg', 'teal', size=(700, 500)))
+        generate_srcset(self.photo.img_file, self.photo.width)
+
+    def test_ladder_below_original(self):
+        """Test that renditions go up to the original, never beyond."""
+        renditions = attach_srcsets([self.photo])[0].renditions
+        self.assertEqual([width for width, img_file in renditions],
+                         [320, 640, 700])
+        self.assertEqual(renditions[0][1].width, 320)
+        self.assertEqual(renditions[-1][1], self.photo.img_file)
+
+    def test_small_original_only(self):
+        """Test that an image narrower than every width is used as is."""
+        photo = PhotoFactory.create(img_file=make_upload('small.jpg'))
+        renditions = attach_srcsets([photo])[0].renditions
+        self.assertEqual(renditions, [(40, photo.img_file)])
+
+    def test_missing_not_made_inline(self):
+        """Test that renditions not made yet are left out, not resized."""
+        photo = PhotoFactory.create(
+            img_file=make_upload('new.jpg', 'olive', size=(500, 400)))
+        renditions = attach_srcsets([photo])[0].renditions
+        self.assertEqual(renditions, [(500, photo.img_file)])
+        self.assertFalse(thumbnail_file(
+            photo.img_file, '320', **SRCSET_OPTIONS).exists())
+
+    def test_generated_srcset_reused(self):
+        """Test that made renditions are found without any query."""
+        made = generate_srcset(self.photo.img_file, self.photo.width)
+        with self.assertNumQueries(0):
+            renditions = attach_srcsets([self.photo])[0].renditions
+        self.assertEqual(renditions[0][1].name, made[320].name)
+
+    def test_srcset_and_src(self):
+        """Test the srcset value and the rendition picked as src."""
+        renditions = attach_srcsets([self.photo])[0].renditions
+        value = srcset(renditions)
+        self.assertEqual(value.count('w, '), 2)
+        self.assertTrue(value.endswith(self.photo.img_file.url + ' 700w'))
+        self.assertEqual(src_rendition(renditions), renditions[1][1])
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class ProfileCountCase(TestCase):
+    """Test that owners' profiles count their photos and albums."""
+
+    def setUp(self):
+        """Add a user owning some photos and albums."""
+        self.user = UserFactory.create()
+        self.photo_batch = PhotoFactory.create_batch(3, owner=self.user)
+        self.album_batch = AlbumFactory.create_batch(2, owner=self.user)
+
+    def get_profile(self):
+        """Return the user's profile as stored."""
+        return ImagerProfile.objects.get(user=self.user)
+
+    def test_created_counted(self):
+        """Test that creating photos and albums counts them."""
+        profile = self.get_profile()
+        self.assertEqual((profile.photo_count, profile.album_count), (3, 2))
+
+    def test_deleted_uncounted(self):
+        """Test that deleting photos and albums uncounts them."""
+        Photo.objects.filter(pk__in=[p.pk for p in self.photo_batch[:2]]
+                             ).delete()
+        self.album_batch[0].delete()
+        profile = self.get_profile()
+        self.assertEqual((profile.photo_count, profile.album_count), (1, 1))
+
+    def test_edit_not_counted(self):
+        """Test that saving an existing photo leaves the count alone."""
+        self.photo_batch[0].title = 'Edited'
+        self.photo_batch[0].save()
+        self.assertEqual(self.get_profile().photo_count, 3)
+
+    def test_bulk_upload_counted(self):
+        """Test that photos made by one bulk insert are counted."""
+        uploads = [make_upload('bulk{}.jpg'.format(num), 'olive')
+                   for num in range(2)]
+        create_photos(self.user, list(zip(uploads, inspect_images(uploads))),
+                      'private')
+        self.assertEqual(self.get_profile().photo_count, 5)
+
+    def test_reconcile_counts_photos(self):
+        """Test that the reconcile command recounts photos and albums."""
+        ImagerProfile.objects.update(photo_count=0, album_count=9)
+        call_command('reconcile_profile_counts', stdout=StringIO())
+        profile = self.get_profile()
+        self.assertEqual((profile.photo_count, profile.album_count), (3, 2))
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class FeedCase(TestCase):
+    """Test fanning shared items out to friends' feeds and reading them."""
+
+    def setUp(self):
+        """Add an owner with two friends and a stranger."""
+        self.owner, self.friend, self.other_friend, self.stranger = (
+            UserFactory.create_batch(4))
+        self.owner.profile.add_friend(self.friend)
+        self.owner.profile.add_friend(self.other_friend)
+
+    def test_shared_fanned_out(self):
+        """Test that a new shared photo reaches every friend's feed."""
+        photo = PhotoFactory.create(owner=self.owner, published='shared')
+        for user in (self.friend, self.other_friend):
+            self.assertEqual([entry.photo for entry in read_feed(user)],
+                             [photo])
+        self.assertFalse(read_feed(self.stranger))
+
+    def test_private_not_fanned_out(self):
+        """Test that private photos and albums reach no feed."""
+        PhotoFactory.create(owner=self.owner, published='private')
+        AlbumFactory.create(owner=self.owner, published='private')
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_publishing_fans_out_once(self):
+        """Test that leaving private fans out, later changes do not."""
+        album = AlbumFactory.create(owner=self.owner, published='private')
+        album.published = 'shared'
+        album.save()
+        album.published = 'public'
+        album.save()
+        self.assertEqual([entry.album for entry in read_feed(self.friend)],
+                         [album])
+
+    def test_back_to_private_withdrawn(self):
+        """Test that making an item private takes it out of every feed."""
+        photo = PhotoFactory.create(owner=self.owner, published='public')
+        photo.published = 'private'
+        photo.save()
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_feed_newest_first(self):
+        """Test that the feed lists entries newest first."""
+        photo_batch = PhotoFactory.create_batch(
+            3, owner=self.owner, published='shared')
+        entries = read_feed(self.friend)
+        self.assertEqual([entry.photo for entry in entries],
+                         photo_batch[::-1])
+
+    def test_read_one_range_query(self):
+        """Test that reading a fanned out feed costs a fixed two queries.
+
+        One is the range read of entries, the other looks for friends who
+        were too popular to fan out. The friend set itself is cached.
+        """
+        PhotoFactory.create_batch(3, owner=self.owner, published='shared')
+        read_feed(self.friend)
+        with self.assertNumQueries(2):
+            read_feed(self.friend)
+
+    @override_settings(IMAGER_FEED_FANOUT_LIMIT=1)
+    def test_popular_owner_pulled(self):
+        """Test that owners with many friends are merged in when read."""
+        photo = PhotoFactory.create(owner=self.owner, published='shared')
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual([entry.photo for entry in read_feed(self.friend)],
+                         [photo])
+        self.assertFalse(read_feed(self.stranger))
+
+    def test_going_over_limit_listed_once(self):
+        """Test that items pushed before the owner went over show once."""
+        photo = PhotoFactory.create(owner=self.owner, published='shared')
+        with self.settings(IMAGER_FEED_FANOUT_LIMIT=1):
+            self.assertEqual(
+                [entry.photo for entry in read_feed(self.friend)], [photo])
+
+    @override_settings(IMAGER_FEED_FANOUT_LIMIT=1)
+    def test_back_under_limit_backfilled(self):
+        """Test that items shared while over the limit stay in feeds."""
+        photo = PhotoFactory.create(owner=self.owner, published='shared')
+        self.owner.profile.friends.remove(self.other_friend.profile)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.friend, photo=photo).exists())
+        self.assertEqual([entry.photo for entry in read_feed(self.friend)],
+                         [photo])
+
+    def test_unfriending_drops_entries(self):
+        """Test that entries between users go when they stop being friends."""
+        photo = PhotoFactory.create(owner=self.owner, published='shared')
+        album = AlbumFactory.create(owner=self.friend, published='shared')
+        self.friend.profile.friends.remove(self.owner.profile)
+        self.assertFalse(read_feed(self.friend))
+        self.assertFalse(read_feed(self.owner))
+        self.assertEqual([entry.photo for entry in read_feed(
+            self.other_friend)], [photo])
+        self.assertFalse(FeedEntry.objects.filter(album=album).exists())
+
+    def test_read_checks_visibility(self):
+        """Test that entries of items the reader may not see are left out."""
+        photo = PhotoFactory.create(owner=self.owner, published='shared')
+        hidden = PhotoFactory.create(owner=self.stranger, published='shared')
+        FeedEntry.objects.create(user=self.friend, actor=self.stranger,
+                                 photo=hidden, date=hidden.date_published)
+        self.assertEqual([entry.photo for entry in read_feed(self.friend)],
+                         [photo])
+        Photo.objects.filter(pk=photo.pk).update(published='private')
+        self.assertFalse(read_feed(self.friend))
+
+    def test_clearing_friends_drops_entries(self):
+        """Test that clearing a user's friends empties their shared feeds."""
+        PhotoFactory.create(owner=self.owner, published='shared')
+        self.owner.profile.friends.clear()
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_trim_feeds(self):
+        """Test that the trim command keeps only the newest entries."""
+        photo_batch = PhotoFactory.create_batch(
+            4, owner=self.owner, published='shared')
+        out = StringIO()
+        call_command('trim_feeds', keep=2, stdout=out)
+        self.assertIn('Deleted 4 old entries from 2 feeds.', out.getvalue())
+        self.assertEqual([entry.photo for entry in read_feed(self.friend)],
+                         photo_batch[:1:-1])
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class SharedVisibilityCase(TestCase):
+    """Test that shared items are visible to the owner's friends only."""
+
+    def setUp(self):
+        """Add an owner's shared, private and public photos and a friend."""
+        self.owner, self.friend, self.stranger = UserFactory.create_batch(3)
+        self.owner.profile.add_friend(self.friend)
+        self.shared = PhotoFactory.create(owner=self.owner, published='shared')
+        self.private = PhotoFactory.create(
+            owner=self.owner, published='private')
+        self.public = PhotoFactory.create(owner=self.owner, published='public')
+
+    def visible(self, user):
+        """Return set of the owner's photos visible to user."""
+        return set(Photo.objects.visible_to(user).filter(owner=self.owner))
+
+    def test_friend_sees_shared(self):
+        """Test that friends see shared and public items, not private."""
+        self.assertTrue(self.shared.is_visible_to(self.friend))
+        self.assertFalse(self.private.is_visible_to(self.friend))
+        self.assertEqual(self.visible(self.friend), {self.shared, self.public})
+
+    def test_stranger_not_shared(self):
+        """Test that other users see only public items."""
+        self.assertFalse(self.shared.is_visible_to(self.stranger))
+        self.assertEqual(self.visible(self.stranger), {self.public})
+
+    def test_owner_sees_all(self):
+        """Test that owners see each of their own items."""
+        self.assertEqual(self.visible(self.owner),
+                         {self.shared, self.private, self.public})
+
+    def test_unfriended_not_shared(self):
+        """Test that removing a friend hides shared items at once."""
+        self.shared.is_visible_to(self.friend)
+        self.owner.profile.friends.remove(self.friend.profile)
+        self.assertFalse(self.shared.is_visible_to(self.friend))
+        self.assertEqual(self.visible(self.friend), {self.public})
+
+    def test_check_cached(self):
+        """Test that repeated checks are answered without queries."""
+        album = AlbumFactory.create(owner=self.owner, published='shared')
+        self.shared.is_visible_to(self.friend)
+        with self.assertNumQueries(0):
+            self.assertTrue(self.shared.is_visible_to(self.friend))
+            self.assertTrue(album.is_visible_to(self.friend))
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class DatePublishedCase(TestCase):
+    """Test that date_published follows changes of publication level."""
+
+    def setUp(self):
+        """Add a private photo and album."""
+        self.owner = UserFactory.create()
+        self.photo = PhotoFactory.create(owner=self.owner, published='private')
+        self.album = AlbumFactory.create(owner=self.owner, published='private')
+
+    def reload(self, instance):
+        """Return the saved date_published of instance."""
+        return type(instance).objects.get(pk=instance.pk).date_published
+
+    def test_publishing_stamps(self):
+        """Test that leaving private stamps the date, kept until private."""
+        for item in (self.photo, self.album):
+            self.assertIsNone(self.reload(item))
+            item.published = 'shared'
+            item.save()
+            stamp = self.reload(item)
+            self.assertTrue(stamp)
+            item.published = 'public'
+            item.save()
+            self.assertEqual(self.reload(item), stamp)
+            item.published = 'private'
+            item.save()
+            self.assertIsNone(self.reload(item))
+
+    def test_update_fields_stamps(self):
+        """Test that saving only published still writes date_published."""
+        self.photo.published = 'public'
+        self.photo.save(update_fields=['published'])
+        self.assertTrue(self.reload(self.photo))
+
+    def test_str_shows_date(self):
+        """Test that published items show their date, not Unpublished."""
+        self.assertIn('Unpublished', str(self.photo))
+        self.photo.published = 'public'
+        self.photo.save()
+        self.assertNotIn('Unpublished', str(self.photo))
+
+    def test_queryset_update(self):
+        """Test that bulk updates stamp new and keep earlier dates."""
+        earlier = PhotoFactory.create(owner=self.owner, published='shared')
+        stamp = self.reload(earlier)
+        Photo.objects.filter(owner=self.owner).update(published='public')
+        self.assertTrue(self.reload(self.photo))
+        self.assertEqual(self.reload(earlier), stamp)
+        Photo.public.filter(owner=self.owner).update(published='private')
+        self.assertFalse(Photo.objects.filter(
+            owner=self.owner, date_published__isnull=False).exists())
+
+    def test_bulk_upload_stamps(self):
+        """Test that photos created in bulk are stamped when not private."""
+        uploads = [make_upload('a.jpg'), make_upload('b.jpg', 'red')]
+        create_photos(self.owner, list(zip(
+            uploads, inspect_images(uploads))), 'public')
+        self.assertEqual(self.owner.photos.filter(
+            published='public', date_published__isnull=False).count(), 2)
+
+    def test_backfill_command(self):
+        """Test that the backfill stamps old public items from upload date."""
+        public = PhotoFactory.create(owner=self.owner, published='public')
+        Photo.objects.filter(pk=public.pk).update(date_published=None)
+        out = StringIO()
+        call_command('backfill_date_published', stdout=out)
+        self.assertIn('Photos: stamped 1, cleared 0.', out.getvalue())
+        public.refresh_from_db()
+        self.assertEqual(public.date_published, public.date_uploaded)
@@ -0,0 +1,298 @@
+"""Generate the standard thumbnails of Photos and look them up in bulk."""
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import settings as sorl_settings, defaults
+from sorl.thumbnail.helpers import serialize, tokey
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE,
+    KVStore as CachedDBKVStore,
+)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+from .gallery import bump_gallery_version
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'grid': '200',
+    'detail': '800',
+}
+# Widths of the renditions offered to browsers in a srcset. They are never
+# upscaled, and only widths narrower than the original are made.
+SRCSET_WIDTHS = (320, 640, 1024, 1600)
+SRCSET_OPTIONS = {'upscale': False}
+SRC_WIDTH = 640
+WORKERS = getattr(settings, 'IMAGER_THUMBNAIL_WORKERS', 2)
+# Seconds before a rendition found missing again is queued once more.
+REQUEUE_AFTER = 60
+
+_pool = None
+_pool_lock = Lock()
+_queued = {}
+_queued_lock = Lock()
+
+
+class SourceNamedBackend(ThumbnailBackend):
+    """Thumbnail backend filing each thumbnail under its source's name.
+
+    A thumbnail of img_files/ab/abc.jpg is stored as
+    cache/img_files/ab/abc.jpg/<key>.jpg, so the image it shows can be
+    told from its name alone.
+    """
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        """Return the name of the thumbnail in a directory of its source."""
+        key = tokey(source.key, geometry_string, serialize(options))
+        return '{}{}/{}.{}'.format(sorl_settings.THUMBNAIL_PREFIX,
+                                   source.name, key,
+                                   EXTENSIONS[options['format']])
+
+
+def thumbnail_source(name):
+    """Return name of the image a thumbnail name was made from, or None."""
+    prefix = sorl_settings.THUMBNAIL_PREFIX
+    if not name.startswith(prefix):
+        return None
+    return os.path.dirname(name[len(prefix):]) or None
+
+
+def generate_renditions(img_file):
+    """Return dict of every standard rendition of img_file, creating them."""
+    return {name: get_thumbnail(img_file, geometry)
+            for name, geometry in RENDITIONS.items()}
+
+
+def srcset_widths(width):
+    """Return list of srcset widths to make of an image width pixels wide.
+
+    Without a known width every width is used.
+    """
+    return [size for size in SRCSET_WIDTHS if width is None or size < width]
+
+
+def generate_srcset(img_file, width=None):
+    """Return dict of srcset renditions of img_file by width, creating them."""
+    return {size: get_thumbnail(img_file, str(size), **SRCSET_OPTIONS)
+            for size in srcset_widths(width)}
+
+
+def renditions_made(img_file):
+    """Mark the Photos showing img_file, and Albums they cover, modified.
+
+    Pages served before the renditions existed showed placeholders, so
+    the validators clients hold for them must stop matching, and cached
+    gallery pages go stale if any of the Photos is public.
+    """
+    photo_model = apps.get_model('imager_images', 'Photo')
+    album_model = apps.get_model('imager_images', 'Album')
+    now = timezone.now()
+    photos = photo_model.objects.filter(img_file=img_file.name)
+    photos.update(date_modified=now)
+    if photos.filter(published='public').exists():
+        bump_gallery_version()
+    album_model.objects.filter(cover__img_file=img_file.name).update(
+        date_modified=now)
+
+
+def render(img_file):
+    """Generate renditions of img_file, returning whether it succeeded."""
+    try:
+        generate_renditions(img_file)
+        generate_srcset(img_file, img_file.width)
+    except Exception:
+        logger.exception('Unable to generate thumbnails for %s.', img_file)
+        return False
+    renditions_made(img_file)
+    return True
+
+
+def render_job(img_file):
+    """Render img_file from a worker thread.
+
+    Workers open their own database connection for sorl-thumbnail's key
+    value store, so it is closed again once the job is done.
+    """
+    try:
+        return render(img_file)
+    finally:
+        connection.close()
+
+
+def get_pool():
+    """Return the process wide worker pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(WORKERS)
+        return _pool
+
+
+def submit(img_file):
+    """Hand img_file to the worker pool without waiting for the result."""
+    get_pool().apply_async(render_job, (img_file,))
+
+
+def schedule_renditions(img_file):
+    """Queue img_file for thumbnail generation once the transaction commits.
+
+    With IMAGER_THUMBNAIL_WORKERS set to 0 the job runs inline instead.
+    """
+    run = submit if WORKERS else render
+    transaction.on_commit(partial(run, img_file))
+
+
+def queue_missing(img_file):
+    """Schedule renditions of an img_file found without some of them.
+
+    Each file is queued at most once every REQUEUE_AFTER seconds per
+    process, so pages requested while it is rendered do not pile up jobs.
+    """
+    now = time.time()
+    with _queued_lock:
+        if _queued.get(img_file.name, 0) > now - REQUEUE_AFTER:
+            return
+        _queued[img_file.name] = now
+        for name, queued in list(_queued.items()):
+            if queued <= now - REQUEUE_AFTER:
+                del _queued[name]
+    schedule_renditions(img_file)
+
+
+def thumbnail_file(img_file, geometry, **options):
+    """Return the unresolved thumbnail ImageFile get_thumbnail would use.
+
+    Options are filled in the same way sorl-thumbnail's backend does, so
+    the name and key value store key match what it stores.
+    """
+    backend = default.backend
+    source = ImageFile(img_file)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def _fetch_raw(keys):
+    """Return dict of raw key value store entries found for keys.
+
+    Hits come from one multi-get on the store's cache, misses from one
+    database query, which are then put back in the cache.
+    """
+    kvstore = default.kvstore
+    found = kvstore.cache.get_many(keys)
+    found = {key: value for key, value in found.items()
+             if value != EMPTY_VALUE}
+    missing = [key for key in keys if key not in found]
+    if missing:
+        rows = KVStoreModel.objects.filter(key__in=missing)
+        from_db = dict(rows.values_list('key', 'value'))
+        kvstore.cache.set_many(from_db, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(from_db)
+    return found
+
+
+def _resolve(requests):
+    """Return list of thumbnails for (img_file, geometry, options) requests.
+
+    Existing thumbnails are read from the key value store together rather
+    than one lookup per image. Any not there yet give None, like empty or
+    broken img_files do, and their images are queued for rendering
+    instead of being resized in the request.
+    """
+    started = time.time()
+    thumbnails = [thumbnail_file(img_file, geometry, **options)
+                  if img_file else None
+                  for img_file, geometry, options in requests]
+    keys = [add_prefix(thumbnail.key) for thumbnail in thumbnails
+            if thumbnail is not None]
+    if isinstance(default.kvstore, CachedDBKVStore):
+        found = _fetch_raw(keys)
+    else:
+        found = {}
+    results = []
+    missing = {}
+    for (img_file, geometry, options), thumbnail in zip(requests, thumbnails):
+        if thumbnail is None:
+            results.append(None)
+        elif add_prefix(thumbnail.key) in found:
+            results.append(
+                deserialize_image_file(found[add_prefix(thumbnail.key)]))
+        else:
+            missing[img_file.name] = img_file
+            results.append(None)
+    for img_file in missing.values():
+        queue_missing(img_file)
+    logger.debug('Resolved %d thumbnails, %d already made, in %.1fms.',
+                 len(results), len(found), (time.time() - started) * 1000)
+    return results
+
+
+def resolve_thumbnails(img_files, geometry=RENDITIONS['grid']):
+    """Return list of thumbnails of img_files at geometry, found in bulk."""
+    return _resolve([(img_file, geometry, {}) for img_file in img_files])
+
+
+def attach_thumbnails(items, get_img_file, geometry=RENDITIONS['grid']):
+    """Return list of items, each with its resolved thumbnail attribute."""
+    items = list(items)
+    img_files = [get_img_file(item) for item in items]
+    for item, thumbnail in zip(items, resolve_thumbnails(img_files, geometry)):
+        item.thumbnail = thumbnail
+    return items
+
+
+def attach_srcsets(photos):
+    """Return list of photos, each with its srcset renditions attribute.
+
+    Renditions is a list of pairs of width and image file, narrowest
+    first, ending with the original when its width is known. The
+    thumbnails of every photo are looked up in one batch.
+    """
+    photos = list(photos)
+    requests = [(photo.img_file, str(size), SRCSET_OPTIONS)
+                for photo in photos for size in srcset_widths(photo.width)]
+    thumbnails = iter(_resolve(requests))
+    for photo in photos:
+        photo.renditions = []
+        for size in srcset_widths(photo.width):
+            thumbnail = next(thumbnails)
+            if thumbnail is not None:
+                photo.renditions.append((size, thumbnail))
+        if photo.img_file and photo.width:
+            photo.renditions.append((photo.width, photo.img_file))
+    return photos
+
+
+def srcset(renditions):
+    """Return srcset attribute value listing renditions by width."""
+    return ', '.join('{} {}w'.format(img_file.url, width)
+                     for width, img_file in renditions)
+
+
+def src_rendition(renditions):
+    """Return the image file of renditions to use as plain src.
+
+    That is the widest no wider than SRC_WIDTH, or else the narrowest.
+    """
+    fitting = [img_file for width, img_file in renditions
+               if width <= SRC_WIDTH]
+    if fitting:
+        return fitting[-1]
+    return renditions[0][1] if renditions else None
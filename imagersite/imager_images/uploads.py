@@ -0,0 +1,84 @@
+"""Check and store whole batches of uploaded images at once."""
+from multiprocessing.pool import ThreadPool
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from imager_profile.models import ImagerProfile, adjust_counts
+from .feed import fan_out_many
+from .gallery import bump_gallery_version
+from .metadata import read_metadata
+from .models import Photo
+from .thumbnails import schedule_renditions
+import os
+
+WORKERS = getattr(settings, 'IMAGER_UPLOAD_WORKERS', 4)
+
+
+def inspect_image(upload):
+    """Return dict of metadata of an uploaded image, or None if invalid.
+
+    Pixels are never decoded, so this is safe to run on many uploads in
+    threads.
+    """
+    try:
+        return read_metadata(upload)
+    except IOError:
+        return None
+
+
+def inspect_images(uploads, workers=WORKERS):
+    """Return list of inspect_image results for uploads, worked in parallel."""
+    if len(uploads) < 2 or workers < 2:
+        return [inspect_image(upload) for upload in uploads]
+    pool = ThreadPool(min(workers, len(uploads)))
+    try:
+        return pool.map(inspect_image, uploads)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def title_from_name(name):
+    """Return a Photo title made from an uploaded file name."""
+    title = os.path.splitext(os.path.basename(name))[0]
+    return title[:Photo._meta.get_field('title').max_length]
+
+
+def create_photos(owner, inspected, published, albums=()):
+    """Create a Photo for every upload in one transaction and one insert.
+
+    Inspected is a list of pairs of upload and its metadata from
+    inspect_image. The new photos are added to each album in albums, and
+    have their thumbnails queued once the transaction commits. Uploads of
+    content stored already share its file and thumbnails. Bulk inserts
+    skip save and send no signals, so date_published is stamped, the
+    owner's photo_count is updated, shared and public photos are fanned
+    out to friends' feeds and public ones are put in the gallery here.
+    Return list of the new photos.
+    """
+    photos = [Photo(owner=owner,
+                    img_file=upload,
+                    title=title_from_name(upload.name),
+                    description='',
+                    published=published,
+                    **metadata)
+              for upload, metadata in inspected]
+    for photo in photos:
+        photo.stamp_published()
+    with transaction.atomic():
+        newest = owner.photos.aggregate(pk=Max('pk'))['pk'] or 0
+        Photo.objects.bulk_create(photos)
+        adjust_counts(ImagerProfile.objects.filter(user=owner),
+                      photo_count=len(photos))
+        img_files = {photo.img_file.name: photo.img_file for photo in photos}
+        created = Photo.objects.filter(
+            owner=owner, img_file__in=list(img_files), pk__gt=newest)
+        for album in albums:
+            album.add_photos(created)
+        if published != 'private':
+            fan_out_many(created)
+        for img_file in img_files.values():
+            schedule_renditions(img_file)
+        if published == 'public':
+            bump_gallery_version()
+    return photos
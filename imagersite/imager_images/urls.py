@@ -2,7 +2,7 @@
 
 from django.conf.urls import url
 from django.contrib.auth.decorators import login_required
-from django.views.generic import TemplateView, DetailView, DeleteView
+from django.views.generic import DeleteView
 from imager_images.models import Photo, Album
 from url_utils import log_perm_required, ADD, EDIT, DELETE
 from .views import (
@@ -10,7 +10,12 @@ from .views import (
     CreateAlbumView,
     EditAlbumView,
     EditPhotoView,
-    AlbumPhotoDetailView,
+    AlbumDetailView,
+    FeedView,
+    GalleryView,
+    PhotoDetailView,
+    BulkUploadView,
+    LibraryView,
 )
 HERE = 'imager_images'
 ALBUM = HERE + '.{}_album'
@@ -19,20 +24,23 @@ PHOTO = HERE + '.{}_photo'
 
 urlpatterns = [
     url(r'^library/$',
-        login_required(
-            TemplateView.as_view(template_name=HERE + '/library.html')),
+        login_required(LibraryView.as_view()),
         name='library'),
 
+    url(r'^feed/$',
+        login_required(FeedView.as_view()),
+        name='feed'),
+
+    url(r'^gallery/$',
+        GalleryView.as_view(),
+        name='gallery'),
+
     url(r'^album/(?P<pk>[0-9]+)/$',
-        AlbumPhotoDetailView.as_view(
-            model=Album,
-            template_name=HERE + '/album.html'),
+        AlbumDetailView.as_view(),
         name='album_detail'),
 
     url(r'^photo/(?P<pk>[0-9]+)/$',
-        AlbumPhotoDetailView.as_view(
-            model=Photo,
-            template_name=HERE + '/photo.html'),
+        PhotoDetailView.as_view(),
         name='photo_detail'),
 
     url(r'^album/(?P<pk>[0-9]+)/edit/$',
@@ -47,6 +55,10 @@ urlpatterns = [
         log_perm_required(PHOTO, ADD, CreatePhotoView.as_view()),
         name='add_photo'),
 
+    url(r'^photo/upload/$',
+        log_perm_required(PHOTO, ADD, BulkUploadView.as_view()),
+        name='upload_photos'),
+
     url(r'^album/add/$',
         log_perm_required(ALBUM, ADD, CreateAlbumView.as_view()),
         name='add_album'),
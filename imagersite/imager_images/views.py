@@ -1,9 +1,111 @@
 """Views for adding, editing and deleting Photos and Albums."""
 
-from django.views.generic import CreateView, UpdateView, DetailView
-from django.db.models import Q
-from .models import Photo, Album
-from .forms import AlbumForm
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db.models import Count, Max
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import condition
+from django.views.generic import (
+    CreateView,
+    UpdateView,
+    DetailView,
+    FormView,
+    TemplateView,
+    View,
+)
+from django.http import FileResponse, Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from imager_profile.friends import friend_user_ids
+from .feed import entry_img_file, read_feed
+from .gallery import cached_page, parse_cursor
+from .models import Photo, Album, DEFAULT_COVER, DEFAULT_COVER_ASSET
+from .forms import AlbumForm, BulkPhotoForm
+from .thumbnails import (
+    attach_srcsets,
+    attach_thumbnails,
+    src_rendition,
+    srcset,
+    thumbnail_source,
+)
+from sorl.thumbnail import default as thumbnail_default
+from operator import attrgetter
+import hashlib
+import mimetypes
+
+MEDIA_MAX_AGE = 24 * 60 * 60
+
+
+def make_etag(*parts):
+    """Return an ETag value hashed from the text of every part."""
+    text = '|'.join('{}'.format(part) for part in parts)
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+class LibraryView(TemplateView):
+    """Show all albums and photos belonging to the current user."""
+
+    template_name = 'imager_images/library.html'
+
+    def get_context_data(self, *args, **kwargs):
+        """Provide the user's albums and photos with their thumbnails."""
+        context_data = super(LibraryView, self).get_context_data(
+            *args, **kwargs)
+        user = self.request.user
+        context_data['albums'] = attach_thumbnails(
+            user.albums.select_related('cover'), Album.get_cover)
+        context_data['photos'] = attach_thumbnails(
+            user.photos.all(), attrgetter('img_file'))
+        return context_data
+
+
+class FeedView(TemplateView):
+    """Show what the current user's friends have shared lately."""
+
+    template_name = 'imager_images/feed.html'
+
+    def get_context_data(self, *args, **kwargs):
+        """Provide the user's feed entries with their thumbnails."""
+        context_data = super(FeedView, self).get_context_data(
+            *args, **kwargs)
+        context_data['entries'] = attach_thumbnails(
+            read_feed(self.request.user), entry_img_file)
+        return context_data
+
+
+def render_gallery_page(photos):
+    """Return HTML of a page of gallery photos with their thumbnails."""
+    return render_to_string('imager_images/gallery_page.html', {
+        'photos': attach_thumbnails(photos, attrgetter('img_file'))})
+
+
+class GalleryView(TemplateView):
+    """Browse everyone's public photos, newest first.
+
+    Pages are found by a before= cursor of the date_published and id of
+    the photo the previous one ended at, written <date_published>-<id>.
+    The first of them are rendered once and then served from the cache.
+    """
+
+    template_name = 'imager_images/gallery.html'
+
+    def get_context_data(self, *args, **kwargs):
+        """Provide the rendered page of photos and a link to the next."""
+        context_data = super(GalleryView, self).get_context_data(
+            *args, **kwargs)
+        try:
+            page, before = parse_cursor(self.request.GET)
+        except ValueError:
+            raise Http404('No such gallery page.')
+        html, next_before = cached_page(
+            'html', page, before, render_gallery_page)
+        context_data['page_html'] = mark_safe(html)
+        if next_before is not None:
+            context_data['next_url'] = '?page={}&before={}'.format(
+                page + 1, next_before)
+        return context_data
 
 
 class AddOrEditMixin(object):
@@ -84,13 +186,192 @@ class EditAlbumView(AddOrEditMixin, UpdateView):
     rel_queryset_name = 'photos'
 
 
+class BulkUploadView(FormView):
+    """Upload many images at once, creating a Photo for each."""
+
+    form_class = BulkPhotoForm
+    template_name = 'imager_images/add_or_edit.html'
+    success_url = '/images/library/'
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        """Spool uploads straight to temporary files on disk.
+
+        Upload handlers must be set before the body is read, which the
+        CSRF check would otherwise do, so it is run afterwards instead.
+        """
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return self.protected_dispatch(request, *args, **kwargs)
+
+    @method_decorator(csrf_protect)
+    def protected_dispatch(self, request, *args, **kwargs):
+        """Dispatch the request once its CSRF token has been checked."""
+        return super(BulkUploadView, self).dispatch(request, *args, **kwargs)
+
+    def get_context_data(self, *args, **kwargs):
+        """Provide context data to the upload page."""
+        context_data = super(BulkUploadView, self).get_context_data(
+            *args, **kwargs)
+        context_data['cancel_url'] = self.success_url
+        context_data['use_case'] = 'Upload'
+        context_data['model_name'] = 'Photos'
+        return context_data
+
+    def get_form(self, form_class=None):
+        """Return the upload form offering only the user's own albums."""
+        form = super(BulkUploadView, self).get_form(form_class=form_class)
+        form.fields['albums'].queryset = self.request.user.albums.all()
+        return form
+
+    def form_valid(self, form):
+        """Create the photos with the current user as their owner."""
+        form.save(self.request.user)
+        return super(BulkUploadView, self).form_valid(form)
+
+
 class AlbumPhotoDetailView(DetailView):
-    """DetailView subclass to filter only public items to non-owners."""
+    """DetailView subclass to show items only to users who may see them.
 
-    def get(self, request, *args, **kwargs):
-        """Allow only public queryset or items belonging to current user."""
-        query = Q(published='public')
-        if request.user.is_authenticated():
-            query |= Q(owner=request.user)
-        self.queryset = self.model.objects.filter(query).distinct()
-        return super(AlbumPhotoDetailView, self).get(request, *args, **kwargs)
+    Conditional GET requests are answered from the item's timestamps,
+    and those of the items related through related_name, before any
+    template is rendered. Only an ETag is sent. It depends on the user,
+    since pages differ between the owner and everyone else, which a
+    Last-Modified date shared by every viewer could not tell apart.
+    """
+
+    related_name = None
+
+    def dispatch(self, request, *args, **kwargs):
+        """Return 304 if the client's copy of the page is still current."""
+        view = condition(etag_func=self.get_etag)(
+            super(AlbumPhotoDetailView, self).dispatch)
+        return view(request, *args, **kwargs)
+
+    def get_validators(self):
+        """Return dict of modification state of the item, if it is visible.
+
+        It is read with one query of the item's own columns and aggregates
+        of its related items, and kept for the rest of the request.
+        """
+        if hasattr(self, '_validators'):
+            return self._validators
+        queryset = self.model.objects.filter(pk=self.kwargs['pk'])
+        if self.related_name:
+            queryset = queryset.annotate(
+                related_modified=Max(self.related_name + '__date_modified'),
+                related_count=Count(self.related_name))
+        fields = ['owner_id', 'published', 'date_modified']
+        if self.related_name:
+            fields += ['related_modified', 'related_count']
+        row = queryset.values(*fields).first()
+        if row is not None:
+            item = self.model(owner_id=row['owner_id'],
+                              published=row['published'])
+            if not item.is_visible_to(self.request.user):
+                row = None
+        self._validators = row
+        return row
+
+    def get_etag(self, request, *args, **kwargs):
+        """Return ETag of the page for the current user, if it exists.
+
+        Whether the user is a friend of the owner is part of it, since
+        the related items listed are those the user may see.
+        """
+        row = self.get_validators()
+        if row is None:
+            return None
+        friend = request.user.pk in friend_user_ids(row['owner_id'])
+        return make_etag(self.model._meta.label, self.kwargs['pk'],
+                         request.user.pk, friend, row['date_modified'],
+                         row.get('related_modified'), row.get('related_count'))
+
+    def get_object(self, queryset=None):
+        """Fetch the item by primary key, then check it may be viewed."""
+        obj = super(AlbumPhotoDetailView, self).get_object(queryset)
+        if not obj.is_visible_to(self.request.user):
+            raise Http404('No {} found matching the query.'.format(
+                self.model._meta.verbose_name))
+        return obj
+
+
+class AlbumDetailView(AlbumPhotoDetailView):
+    """Album detail page listing its photos with their thumbnails."""
+
+    model = Album
+    template_name = 'imager_images/album.html'
+    related_name = 'photos'
+
+    def get_context_data(self, *args, **kwargs):
+        """Provide the album's photos the user may see, with thumbnails."""
+        context_data = super(AlbumDetailView, self).get_context_data(
+            *args, **kwargs)
+        photos = self.object.photos.visible_to(self.request.user)
+        context_data['photos'] = attach_thumbnails(
+            photos, attrgetter('img_file'))
+        return context_data
+
+
+class PhotoDetailView(AlbumPhotoDetailView):
+    """Photo detail page offering the image at several widths."""
+
+    model = Photo
+    template_name = 'imager_images/photo.html'
+    related_name = 'albums'
+
+    def get_context_data(self, *args, **kwargs):
+        """Provide the photo's renditions and the albums the user may see."""
+        context_data = super(PhotoDetailView, self).get_context_data(
+            *args, **kwargs)
+        context_data['albums'] = self.object.albums.visible_to(
+            self.request.user)
+        renditions = attach_srcsets([self.object])[0].renditions
+        context_data['src'] = src_rendition(renditions) or self.object.img_file
+        context_data['srcset'] = srcset(renditions)
+        return context_data
+
+
+class MediaView(View):
+    """Serve an uploaded image to users allowed to see a Photo using it.
+
+    Thumbnails are checked against the Photos of the image they were
+    made from, which their name gives. Thumbnails of the default album
+    cover are public. The bytes never pass through Python when a front
+    end server is set in IMAGER_MEDIA_ACCEL: 'nginx' answers with
+    X-Accel-Redirect to the internal IMAGER_MEDIA_ACCEL_PREFIX location,
+    'apache' with X-Sendfile of the file's path. Otherwise the file is
+    streamed with a FileResponse, which the WSGI server may send with
+    sendfile.
+    """
+
+    def get(self, request, path):
+        """Return the file at path in media storage, or 404 if hidden."""
+        source = thumbnail_source(path)
+        storage = thumbnail_default.storage if source else default_storage
+        if source in (DEFAULT_COVER, DEFAULT_COVER_ASSET):
+            public = True
+        else:
+            photos = list(Photo.objects.filter(img_file=source or path).only(
+                'owner', 'published', 'img_file'))
+            if not any(photo.is_visible_to(request.user) for photo in photos):
+                raise Http404('No such file.')
+            public = any(photo.published == 'public' for photo in photos)
+        content_type = mimetypes.guess_type(path)[0]
+        accel = getattr(settings, 'IMAGER_MEDIA_ACCEL', None)
+        if accel == 'nginx':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = (
+                settings.IMAGER_MEDIA_ACCEL_PREFIX + path)
+        elif accel == 'apache':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = storage.path(path)
+        else:
+            try:
+                stored = storage.open(path)
+            except (IOError, OSError):
+                raise Http404('No such file.')
+            response = FileResponse(stored, content_type=content_type)
+            response['Content-Length'] = stored.size
+        response['Cache-Control'] = '{}, max-age={}'.format(
+            'public' if public else 'private', MEDIA_MAX_AGE)
+        return response
@@ -0,0 +1,113 @@
+"""Authentication backend remembering user permissions across requests."""
+from functools import partial
+from threading import Lock
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = getattr(settings, 'IMAGER_PERMISSION_CACHE_TIMEOUT', 300)
+# ModelBackend loads permissions with one query for the user's own and
+# one for their groups', so each cache hit saves this many queries.
+QUERIES_PER_LOAD = 2
+GLOBAL_VERSION_KEY = 'perm_version'
+USER_VERSION_KEY = 'perm_version:{}'
+PERMISSIONS_KEY = 'perms:{}:{}:{}'
+
+_stats_lock = Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def version_seed():
+    """Return a version number for a version key found missing.
+
+    It is taken from the clock in milliseconds, so it is above any
+    version an evicted key reached unless that was bumped faster than
+    once a millisecond.
+    """
+    return int(time.time() * 1000)
+
+
+def _bump(key):
+    """Increment the version under key, seeding it afresh if missing."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, version_seed(), None)
+
+
+def bump_permission_version(user_id=None):
+    """Make cached permissions of user_id, or of every user, stale.
+
+    The version is bumped at once and again when the transaction
+    commits. A request running alongside it may read the permissions
+    from before the commit and cache them under the first bump, which
+    the second one leaves behind.
+    """
+    key = GLOBAL_VERSION_KEY if user_id is None else USER_VERSION_KEY.format(
+        user_id)
+    _bump(key)
+    transaction.on_commit(partial(_bump, key))
+
+
+def permissions_key(user_id):
+    """Return cache key of user_id's permissions at their current version.
+
+    Missing versions are seeded afresh rather than read as 0, so sets
+    cached under a version from before an eviction are not read again.
+    """
+    user_key = USER_VERSION_KEY.format(user_id)
+    versions = cache.get_many([GLOBAL_VERSION_KEY, user_key])
+    for key in (GLOBAL_VERSION_KEY, user_key):
+        if key not in versions:
+            seed = version_seed()
+            if not cache.add(key, seed, None):
+                seed = cache.get(key, seed)
+            versions[key] = seed
+    return PERMISSIONS_KEY.format(versions[GLOBAL_VERSION_KEY], user_id,
+                                  versions[user_key])
+
+
+def stats():
+    """Return dict of cache hits, misses and database queries saved."""
+    with _stats_lock:
+        result = dict(_stats)
+    result['queries_saved'] = result['hits'] * QUERIES_PER_LOAD
+    return result
+
+
+def _count(name):
+    """Add one to the named counter."""
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend keeping each user's permission set in the cache.
+
+    Entries are keyed by the user and by a per user and a site wide
+    version, which bump_permission_version increments whenever
+    permissions may have changed, so stale entries are never read.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        """Return set of the user's permission names, cached if possible."""
+        if (not user_obj.is_active or user_obj.is_anonymous() or
+                obj is not None):
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permissions_key(user_obj.pk)
+            perms = cache.get(key)
+            if perms is None:
+                _count('misses')
+                perms = super(CachedModelBackend, self).get_all_permissions(
+                    user_obj)
+                cache.set(key, perms, TIMEOUT)
+            else:
+                _count('hits')
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
@@ -0,0 +1,42 @@
+"""Cached sets of each user's friends, for checks made on every request."""
+from functools import partial
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import ImagerProfile
+
+TIMEOUT = getattr(settings, 'IMAGER_FRIENDS_CACHE_TIMEOUT', 600)
+FRIENDS_KEY = 'friends:{}'
+
+
+def friend_user_ids(user_id):
+    """Return frozenset of pks of the users friends with user_id.
+
+    The set is read with one query and then kept in the cache, whose
+    local tier holds it in process memory, until friendships change.
+    """
+    key = FRIENDS_KEY.format(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(ImagerProfile.objects.filter(
+            friends__user_id=user_id).values_list('user_id', flat=True))
+        cache.set(key, ids, TIMEOUT)
+    return ids
+
+
+def forget_friend_user_ids(user_ids):
+    """Drop cached friend sets of the users in user_ids.
+
+    They are dropped at once and again when the transaction commits, so
+    a set re-cached meanwhile by a request reading the friendships from
+    before the commit is not kept.
+    """
+    keys = [FRIENDS_KEY.format(pk) for pk in user_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(partial(cache.delete_many, keys))
+
+
+def forget_friends(profile_ids):
+    """Drop cached friend sets of the users of profiles in profile_ids."""
+    forget_friend_user_ids(ImagerProfile.objects.filter(
+        pk__in=profile_ids).values_list('user_id', flat=True))
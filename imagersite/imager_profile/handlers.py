@@ -1,13 +1,23 @@
 # -*- coding: utf-8 -*-
-"""Handlers for pop-save and pre-delete events on User model."""
+"""Handlers for events on User model and models counted on profiles."""
 from __future__ import unicode_literals
 from django.conf import settings
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import (
+    post_save,
+    pre_delete,
+    post_delete,
+    m2m_changed,
+    post_migrate,
+)
 from registration.signals import user_activated
 from registration.backends.hmac.views import ActivationView
+from django.db.models import Q
 from django.dispatch import receiver
-from .models import ImagerProfile
-from django.contrib.auth.models import Permission
+from .backends import bump_permission_version
+from .friends import forget_friends, forget_friend_user_ids
+from .models import ImagerProfile, adjust_counts
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,6 +27,8 @@ ACTIONS = ['add', 'change', 'delete']
 PERMS = ['_'.join((action, model)) for action in ACTIONS for model in MODELS]
 PERMS += ['change_user', 'change_imagerprofile']
 
+_permission_ids = {}
+
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def ensure_imager_profile(sender, **kwargs):
@@ -26,23 +38,80 @@ def ensure_imager_profile(sender, **kwargs):
             user = kwargs['instance']
             new_profile = ImagerProfile(user=user)
             new_profile.save()
+            forget_friend_user_ids([user.pk])
         except (KeyError, ValueError):
             logger.error('Unable to create ImagerProfile for User instance.')
 
 
+def permission_ids(codenames=PERMS):
+    """Return list of pks of the permissions named in codenames.
+
+    They are looked up in one query and kept for the life of the process.
+    Missing permissions are logged and left out.
+    """
+    key = tuple(codenames)
+    if key not in _permission_ids:
+        found = dict(Permission.objects.filter(
+            codename__in=codenames).values_list('codename', 'pk'))
+        missing = set(codenames) - set(found)
+        if missing:
+            logger.error('Permissions not found: %s.',
+                         ', '.join(sorted(missing)))
+        _permission_ids[key] = list(found.values())
+    return _permission_ids[key]
+
+
+@receiver(post_migrate)
+def forget_permission_ids(sender, **kwargs):
+    """Drop cached permission pks, which migrating may have changed."""
+    _permission_ids.clear()
+
+
 @receiver(user_activated, sender=ActivationView)
 def add_permissions(sender, **kwargs):
-    """Create and save an ImagerProfile after every new User is created."""
+    """Grant every imager permission to a newly activated user at once."""
     try:
         user = kwargs['user']
-        try:
-            for codename in PERMS:
-                perm = Permission.objects.get(codename=codename)
-                user.user_permissions.add(perm)
-        except Permission.DoesNotExist:
-            logger.error('Permission not found.')
-    except (KeyError, ValueError):
+    except KeyError:
         logger.error('User not sent with user_activated signal.')
+        return
+    user.user_permissions.add(*permission_ids())
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_user_permissions(sender, **kwargs):
+    """Drop cached permissions of a saved user, unless only logging in.
+
+    Saving covers new users reusing a pk and changes of is_active or
+    is_superuser, from the admin or anywhere else.
+    """
+    if kwargs.get('update_fields') != frozenset(['last_login']):
+        bump_permission_version(kwargs['instance'].pk)
+
+
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through)
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def forget_changed_permissions(sender, **kwargs):
+    """Drop cached permissions of users whose permissions were changed.
+
+    That includes permissions granted by add_permissions. Changes made
+    from the permission or group side may touch many users, so every
+    user's cached permissions are dropped then.
+    """
+    if kwargs['action'].startswith('post'):
+        if kwargs['reverse']:
+            bump_permission_version()
+        else:
+            bump_permission_version(kwargs['instance'].pk)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def forget_all_permissions(sender, **kwargs):
+    """Drop every cached permission set after groups or permissions change."""
+    if kwargs.get('action', 'post').startswith('post'):
+        bump_permission_version()
 
 
 @receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
@@ -55,3 +124,77 @@ def remove_imager_profile(sender, **kwargs):
         instance.save()
     except (KeyError, AttributeError):
         logger.warn('ImagerProfile instance not deleted.')
+
+
+COUNTERS = {
+    'imager_images.Photo': 'photo_count',
+    'imager_images.Album': 'album_count',
+}
+
+
+@receiver(post_save, sender='imager_images.Photo')
+@receiver(post_save, sender='imager_images.Album')
+def count_created(sender, **kwargs):
+    """Add a new photo or album to its owner's profile counter."""
+    if kwargs.get('created') and not kwargs.get('raw'):
+        owner_id = kwargs['instance'].owner_id
+        adjust_counts(ImagerProfile.objects.filter(user_id=owner_id),
+                      **{COUNTERS[sender._meta.label]: 1})
+
+
+@receiver(post_delete, sender='imager_images.Photo')
+@receiver(post_delete, sender='imager_images.Album')
+def count_deleted(sender, **kwargs):
+    """Take a deleted photo or album off its owner's profile counter."""
+    owner_id = kwargs['instance'].owner_id
+    adjust_counts(ImagerProfile.objects.filter(user_id=owner_id),
+                  **{COUNTERS[sender._meta.label]: -1})
+
+
+@receiver(m2m_changed, sender=ImagerProfile.friends.through)
+def count_friends(sender, **kwargs):
+    """Keep friend counts and cached friend sets of both sides in step.
+
+    Adding and removing mirror rows happen outside the signals, so the
+    friendships really changed are worked out from the rows present
+    before the change rather than counted afterwards.
+    """
+    action, instance = kwargs['action'], kwargs['instance']
+    friends = ImagerProfile.friends.through.objects.filter(
+        from_imagerprofile_id=instance.pk)
+    if action == 'pre_remove':
+        friends = friends.filter(to_imagerprofile_id__in=kwargs['pk_set'])
+    if action in ('pre_remove', 'pre_clear'):
+        instance._removed_friend_ids = set(
+            friends.values_list('to_imagerprofile_id', flat=True))
+        return
+    if action == 'post_add':
+        changed, delta = kwargs['pk_set'], 1
+    elif action in ('post_remove', 'post_clear'):
+        changed, delta = instance.__dict__.pop('_removed_friend_ids'), -1
+    else:
+        return
+    if changed:
+        adjust_counts(ImagerProfile.objects.filter(pk=instance.pk),
+                      friend_count=delta * len(changed))
+        adjust_counts(ImagerProfile.objects.filter(pk__in=changed),
+                      friend_count=delta)
+        forget_friends(set(changed) | {instance.pk})
+
+
+@receiver(pre_delete, sender=ImagerProfile)
+def uncount_friendships(sender, **kwargs):
+    """Take a deleted profile off the friend counts and sets of its friends.
+
+    Its friendship rows are deleted here, so the profile is uncounted
+    only once even when pre_delete is sent for it twice in one cascade.
+    """
+    pk = kwargs['instance'].pk
+    friendships = ImagerProfile.friends.through.objects.filter(
+        Q(from_imagerprofile_id=pk) | Q(to_imagerprofile_id=pk))
+    friend_ids = set(friendships.filter(from_imagerprofile_id=pk).values_list(
+        'to_imagerprofile_id', flat=True))
+    friendships.delete()
+    adjust_counts(ImagerProfile.objects.filter(pk__in=friend_ids),
+                  friend_count=-1)
+    forget_friends(friend_ids | {pk})
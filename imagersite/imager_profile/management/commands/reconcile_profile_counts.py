@@ -0,0 +1,52 @@
+"""Repair photo, album and friend counters stored on ImagerProfiles."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from imager_images.models import Photo, Album
+from imager_profile.models import ImagerProfile
+
+
+def actual_counts():
+    """Return dict of counter values by profile pk, counted in bulk."""
+    photos = dict(Photo.objects.order_by().values_list('owner').annotate(
+        Count('pk')))
+    albums = dict(Album.objects.order_by().values_list('owner').annotate(
+        Count('pk')))
+    friendships = ImagerProfile.friends.through.objects.order_by()
+    friends = dict(friendships.values_list('from_imagerprofile').annotate(
+        Count('pk')))
+    profiles = ImagerProfile.objects.values_list('pk', 'user_id')
+    return {pk: {'photo_count': photos.get(user_id, 0),
+                 'album_count': albums.get(user_id, 0),
+                 'friend_count': friends.get(pk, 0)}
+            for pk, user_id in profiles}
+
+
+class Command(BaseCommand):
+    """Count what each profile's counters stand for and fix any drift."""
+
+    help = 'Recount photos, albums and friends of every profile.'
+
+    def add_arguments(self, parser):
+        """Allow reporting drift without repairing it."""
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Only report profiles whose counters are wrong.')
+
+    def handle(self, *args, **options):
+        """Recount with grouped queries and update only drifted profiles."""
+        with transaction.atomic():
+            counts = actual_counts()
+            stored = ImagerProfile.objects.values(
+                'pk', 'photo_count', 'album_count', 'friend_count')
+            drifted = {}
+            for row in stored.select_for_update():
+                pk = row.pop('pk')
+                if row != counts[pk]:
+                    drifted[pk] = counts[pk]
+            if not options['dry_run']:
+                for pk, values in drifted.items():
+                    ImagerProfile.objects.filter(pk=pk).update(**values)
+        self.stdout.write('{} of {} profiles had wrong counters{}.'.format(
+            len(drifted), len(counts),
+            '' if options['dry_run'] else ' and were repaired'))
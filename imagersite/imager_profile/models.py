@@ -22,6 +22,9 @@ class ImagerProfile(md.Model):
     location = md.CharField(null=True, blank=True, max_length=255)
     camera = md.CharField(null=True, blank=True, max_length=255)
     fav_photo = md.CharField(null=True, blank=True, max_length=255)
+    photo_count = md.IntegerField(default=0, editable=False)
+    album_count = md.IntegerField(default=0, editable=False)
+    friend_count = md.IntegerField(default=0, editable=False)
 
     objects = md.Manager()
     active = ActiveManager()
@@ -43,3 +46,31 @@ class ImagerProfile(md.Model):
     def add_friend(self, other_user):
         """Take a User make a new relationship with its profile."""
         self.friends.add(other_user.profile)
+
+    def mutual_friends(self, other):
+        """Return QuerySet of profiles friends with this and other profile."""
+        return ImagerProfile.objects.filter(friends=self).filter(
+            friends=other)
+
+    def suggested_friends(self, limit=10):
+        """Return QuerySet of friends of friends who are not friends yet.
+
+        Each is annotated with its number of mutual friends and the most
+        connected come first. It runs as one query over the friendship
+        table's (from, to) index.
+        """
+        friend_ids = ImagerProfile.friends.through.objects.filter(
+            from_imagerprofile=self).values('to_imagerprofile')
+        candidates = ImagerProfile.objects.filter(friends__friends=self)
+        candidates = candidates.exclude(pk=self.pk).exclude(
+            pk__in=friend_ids)
+        return candidates.annotate(mutual=md.Count('friends')).order_by(
+            '-mutual', 'pk')[:limit]
+
+
+def adjust_counts(profiles, **deltas):
+    """Add deltas to the named counters of QuerySet profiles in one update."""
+    changes = {name: md.F(name) + delta
+               for name, delta in deltas.items() if delta}
+    if changes:
+        profiles.update(**changes)
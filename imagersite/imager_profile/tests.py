@@ -1,8 +1,25 @@
 """Test ImagerProfile model."""
 from __future__ import unicode_literals
 from django.conf import settings
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
 from django.db.models import QuerySet, Manager
+from registration.backends.hmac.views import ActivationView
+from registration.signals import user_activated
+from .backends import (
+    GLOBAL_VERSION_KEY,
+    USER_VERSION_KEY,
+    permissions_key,
+    stats,
+)
+from .friends import FRIENDS_KEY, friend_user_ids
+from .handlers import PERMS, permission_ids
 from .models import ImagerProfile
 import random
 import factory
@@ -145,3 +162,262 @@ class ManyUsersCase(TestCase):
         for user in self.user_batch:
             self.assertEqual(user.profile.friends.count(),
                              USER_BATCH_SIZE // 2)
+
+
+class FriendCountCase(TestCase):
+    """Test that friend_count follows changes to friendships."""
+
+    def setUp(self):
+        """Add a few Users to the test."""
+        self.user_batch = UserFactory.create_batch(4)
+        self.profiles = [user.profile for user in self.user_batch]
+
+    def assertCounts(self, *expected):
+        """Assert the stored friend_count of each profile in turn."""
+        counts = [ImagerProfile.objects.get(pk=profile.pk).friend_count
+                  for profile in self.profiles]
+        self.assertEqual(counts, list(expected))
+
+    def test_add_friends(self):
+        """Test that adding friends counts on both sides, once each."""
+        first = self.profiles[0]
+        first.friends.add(*self.profiles[1:])
+        first.friends.add(self.profiles[1])
+        self.assertCounts(3, 1, 1, 1)
+
+    def test_remove_friends(self):
+        """Test that removing counts only friendships which existed."""
+        first = self.profiles[0]
+        first.friends.add(self.profiles[1])
+        first.friends.remove(self.profiles[1], self.profiles[2])
+        self.assertCounts(0, 0, 0, 0)
+
+    def test_reverse_remove(self):
+        """Test that removing from the other side updates both counts."""
+        self.profiles[0].add_friend(self.user_batch[1])
+        self.profiles[1].friends.remove(self.profiles[0])
+        self.assertCounts(0, 0, 0, 0)
+
+    def test_clear_friends(self):
+        """Test that clearing takes the profile off every friend's count."""
+        first = self.profiles[0]
+        first.friends.add(*self.profiles[1:])
+        self.profiles[1].friends.add(self.profiles[2])
+        first.friends.clear()
+        self.assertCounts(0, 1, 1, 0)
+
+    def test_delete_user(self):
+        """Test that deleting a user takes them off their friends' counts."""
+        self.profiles[0].friends.add(*self.profiles[1:])
+        self.user_batch[0].delete()
+        self.profiles.pop(0)
+        self.assertCounts(0, 0, 0)
+
+    def test_reconcile(self):
+        """Test that the reconcile command repairs drifted counters."""
+        self.profiles[0].friends.add(self.profiles[1])
+        ImagerProfile.objects.update(friend_count=7)
+        out = StringIO()
+        call_command('reconcile_profile_counts', stdout=out)
+        self.assertIn('4 of 4 profiles', out.getvalue())
+        self.assertCounts(1, 1, 0, 0)
+
+    def test_reconcile_dry_run(self):
+        """Test that a dry run reports drift without repairing it."""
+        ImagerProfile.objects.filter(pk=self.profiles[0].pk).update(
+            friend_count=2)
+        out = StringIO()
+        call_command('reconcile_profile_counts', dry_run=True, stdout=out)
+        self.assertIn('1 of 4 profiles', out.getvalue())
+        self.assertCounts(2, 0, 0, 0)
+
+
+class ActivationPermissionCase(TestCase):
+    """Test granting permissions to users when they activate."""
+
+    def setUp(self):
+        """Add a User and resolve the permissions to grant."""
+        self.user = UserFactory.create()
+        permission_ids()
+
+    def activate(self):
+        """Send the activation signal for the user."""
+        user_activated.send(sender=ActivationView, user=self.user,
+                            request=None)
+
+    def test_all_granted(self):
+        """Test that every imager permission is granted."""
+        self.activate()
+        codenames = set(self.user.user_permissions.values_list(
+            'codename', flat=True))
+        self.assertEqual(codenames, set(PERMS))
+
+    def test_grant_fixed_queries(self):
+        """Test that granting costs one lookup and one insert."""
+        with self.assertNumQueries(2):
+            self.activate()
+
+    def test_grant_twice(self):
+        """Test that activating again grants nothing new."""
+        self.activate()
+        self.activate()
+        self.assertEqual(self.user.user_permissions.count(), len(PERMS))
+
+    def test_missing_permission(self):
+        """Test that a missing permission does not stop the others."""
+        ids = permission_ids(PERMS + ['fly_photo'])
+        self.assertEqual(len(ids), len(PERMS))
+
+
+class PermissionCacheCase(TestCase):
+    """Test that permission sets are cached between requests."""
+
+    def setUp(self):
+        """Add a User allowed to add photos."""
+        self.user = UserFactory.create()
+        self.add_photo = Permission.objects.get(codename='add_photo')
+        self.user.user_permissions.add(self.add_photo)
+
+    def fresh_user(self):
+        """Return the user as loaded by a new request."""
+        return get_user_model().objects.get(pk=self.user.pk)
+
+    def test_second_load_cached(self):
+        """Test that a later request reads permissions without queries."""
+        self.assertTrue(self.fresh_user().has_perm('imager_images.add_photo'))
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('imager_images.add_photo'))
+
+    def test_stats_count_saved_queries(self):
+        """Test that hits are counted with the queries they saved."""
+        self.fresh_user().get_all_permissions()
+        before = stats()
+        self.fresh_user().get_all_permissions()
+        after = stats()
+        self.assertEqual(after['hits'], before['hits'] + 1)
+        self.assertEqual(after['queries_saved'], before['queries_saved'] + 2)
+
+    def test_grant_invalidates(self):
+        """Test that granting a permission is seen by the next request."""
+        self.fresh_user().get_all_permissions()
+        self.user.user_permissions.add(
+            Permission.objects.get(codename='add_album'))
+        self.assertTrue(self.fresh_user().has_perm('imager_images.add_album'))
+
+    def test_evicted_version_not_reused(self):
+        """Test that losing the version keys does not revive stale sets."""
+        version_keys = [GLOBAL_VERSION_KEY,
+                        USER_VERSION_KEY.format(self.user.pk)]
+        cache.delete_many(version_keys)
+        self.fresh_user().get_all_permissions()
+        self.user.user_permissions.add(
+            Permission.objects.get(codename='add_album'))
+        cache.delete_many(version_keys)
+        self.assertTrue(self.fresh_user().has_perm('imager_images.add_album'))
+
+    def test_group_change_invalidates(self):
+        """Test that taking a permission from a group is seen at once."""
+        group = Group.objects.create(name='Albumers')
+        add_album = Permission.objects.get(codename='add_album')
+        group.permissions.add(add_album)
+        self.user.groups.add(group)
+        self.assertTrue(self.fresh_user().has_perm('imager_images.add_album'))
+        group.permissions.remove(add_album)
+        self.assertFalse(self.fresh_user().has_perm('imager_images.add_album'))
+
+    def test_deactivate_invalidates(self):
+        """Test that an inactive user loses cached permissions."""
+        self.fresh_user().get_all_permissions()
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.fresh_user().has_perm('imager_images.add_photo'))
+
+    def test_protected_view_skips_permission_queries(self):
+        """Test that repeat requests of a protected page skip the lookup."""
+        self.user.user_permissions.add(
+            Permission.objects.get(codename='change_user'))
+        client = Client()
+        client.force_login(self.user)
+        client.get('/profile/edit/')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/profile/edit/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'auth_permission' in query['sql']])
+
+
+class PermissionCommitCase(TransactionTestCase):
+    """Test permission changes against requests running alongside them."""
+
+    def test_set_cached_before_commit_dropped(self):
+        """Test that a set cached from rows before a commit is not kept."""
+        user = UserFactory.create()
+        with transaction.atomic():
+            user.user_permissions.add(
+                Permission.objects.get(codename='add_album'))
+            cache.set(permissions_key(user.pk), set())
+        user = get_user_model().objects.get(pk=user.pk)
+        self.assertTrue(user.has_perm('imager_images.add_album'))
+
+
+class FriendCommitCase(TransactionTestCase):
+    """Test friendship changes against requests running alongside them."""
+
+    def test_set_cached_before_commit_dropped(self):
+        """Test that a friend set cached before a commit is not kept."""
+        user, friend = UserFactory.create_batch(2)
+        with transaction.atomic():
+            user.profile.add_friend(friend)
+            cache.set(FRIENDS_KEY.format(user.pk), frozenset())
+        self.assertEqual(friend_user_ids(user.pk), {friend.pk})
+
+
+class FriendGraphCase(TestCase):
+    """Test mutual friend and suggestion queries and cached friend sets."""
+
+    def setUp(self):
+        """Build a small graph: 0 knows 1 and 2, who both know 3 and 4."""
+        self.user_batch = UserFactory.create_batch(6)
+        self.profiles = [user.profile for user in self.user_batch]
+        me, first, second, third, fourth, loner = self.profiles
+        me.friends.add(first, second)
+        first.friends.add(third, fourth)
+        second.friends.add(third)
+
+    def test_mutual_friends(self):
+        """Test that mutual friends of two profiles are found."""
+        mutual = self.profiles[0].mutual_friends(self.profiles[3])
+        self.assertEqual(set(mutual), set(self.profiles[1:3]))
+
+    def test_suggestions_ranked(self):
+        """Test that friends of friends are suggested, best connected first."""
+        with self.assertNumQueries(1):
+            suggested = list(self.profiles[0].suggested_friends())
+        self.assertEqual(suggested, [self.profiles[3], self.profiles[4]])
+        self.assertEqual([profile.mutual for profile in suggested], [2, 1])
+
+    def test_suggestions_exclude_friends(self):
+        """Test that existing friends and self are never suggested."""
+        suggested = set(self.profiles[1].suggested_friends())
+        self.assertEqual(suggested, {self.profiles[2]})
+
+    def test_friend_user_ids_cached(self):
+        """Test that a user's friend set is read once, then cached."""
+        user_id = self.user_batch[0].pk
+        friend_user_ids(user_id)
+        with self.assertNumQueries(0):
+            ids = friend_user_ids(user_id)
+        self.assertEqual(ids, {self.user_batch[1].pk, self.user_batch[2].pk})
+
+    def test_friend_user_ids_invalidated(self):
+        """Test that changing friendships refreshes both sides' sets."""
+        me, loner = self.user_batch[0], self.user_batch[5]
+        friend_user_ids(me.pk)
+        friend_user_ids(loner.pk)
+        me.profile.add_friend(loner)
+        self.assertIn(loner.pk, friend_user_ids(me.pk))
+        self.assertEqual(friend_user_ids(loner.pk), {me.pk})
+        me.profile.friends.clear()
+        self.assertFalse(friend_user_ids(me.pk))
+        self.assertFalse(friend_user_ids(loner.pk))
@@ -0,0 +1,193 @@
+"""Two tier cache backend: an in-process LRU in front of a shared cache.
+
+Reads are served from a small per-process LRU when possible, then from
+the shared cache named by LOCATION, filling the LRU on the way back.
+Writes and deletes go through to both tiers. Other processes cannot
+reach this process' LRU, so local entries are kept for at most
+LOCAL_TIMEOUT seconds; that bounds how stale a read here can be after
+another process writes the same key.
+"""
+from collections import OrderedDict
+from threading import Lock
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.utils.six.moves import cPickle as pickle
+import time
+
+LOCAL_TIMEOUT = 5
+
+
+class LocalLRU(object):
+    """Bounded, thread safe least recently used store of expiring values."""
+
+    def __init__(self, max_entries, clock=time.time):
+        """Hold up to max_entries values, timed by the given clock."""
+        self.max_entries = max_entries
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """Return tuple of whether key was found and its value."""
+        with self._lock:
+            try:
+                expiry, value = self._data.pop(key)
+            except KeyError:
+                return False, None
+            if expiry <= self.clock():
+                return False, None
+            self._data[key] = (expiry, value)
+            return True, pickle.loads(value)
+
+    def set(self, key, value, ttl):
+        """Store value under key for ttl seconds, evicting the oldest."""
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (self.clock() + ttl, value)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove key if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every key."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        """Return number of values held, including expired ones."""
+        return len(self._data)
+
+
+class TieredCache(BaseCache):
+    """Cache backend reading through a local LRU to a shared cache."""
+
+    def __init__(self, location, params):
+        """Set up the local tier in front of the cache aliased location."""
+        super(TieredCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = location
+        self.local_timeout = options.get('LOCAL_TIMEOUT', LOCAL_TIMEOUT)
+        self.local = LocalLRU(self._max_entries)
+        self._stats_lock = Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @property
+    def shared(self):
+        """Return the shared cache for the current thread."""
+        return caches[self.shared_alias]
+
+    def stats(self):
+        """Return dict of hit and miss counts of each tier so far."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, name, num=1):
+        """Add num to the named counter."""
+        if num:
+            with self._stats_lock:
+                self._stats[name] += num
+
+    def _local_ttl(self, timeout):
+        """Return seconds to keep a value locally given its timeout."""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Set value only if key is not in the shared cache yet."""
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self.local.set(self.make_key(key, version), value,
+                           self._local_ttl(timeout))
+        return added
+
+    def get(self, key, default=None, version=None):
+        """Return value of key from the nearest tier holding it."""
+        local_key = self.make_key(key, version)
+        found, value = self.local.get(local_key)
+        if found:
+            self._count('local_hits')
+            return value
+        value = self.shared.get(key, self, version)
+        if value is self:
+            self._count('misses')
+            return default
+        self._count('shared_hits')
+        self.local.set(local_key, value, self.local_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        """Return dict of found keys, asking the shared tier only once."""
+        found = {}
+        missing = []
+        for key in keys:
+            hit, value = self.local.get(self.make_key(key, version))
+            if hit:
+                found[key] = value
+            else:
+                missing.append(key)
+        self._count('local_hits', len(found))
+        if missing:
+            shared = self.shared.get_many(missing, version)
+            for key, value in shared.items():
+                self.local.set(self.make_key(key, version), value,
+                               self.local_timeout)
+            found.update(shared)
+            self._count('shared_hits', len(shared))
+            self._count('misses', len(missing) - len(shared))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Write value through to both tiers."""
+        self.shared.set(key, value, timeout, version)
+        self.local.set(self.make_key(key, version), value,
+                       self._local_ttl(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        """Write every value through to both tiers."""
+        self.shared.set_many(data, timeout, version)
+        ttl = self._local_ttl(timeout)
+        for key, value in data.items():
+            self.local.set(self.make_key(key, version), value, ttl)
+
+    def delete(self, key, version=None):
+        """Delete key from both tiers."""
+        self.local.delete(self.make_key(key, version))
+        self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        """Delete every key from both tiers."""
+        for key in keys:
+            self.local.delete(self.make_key(key, version))
+        self.shared.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        """Return whether either tier holds key."""
+        found, value = self.local.get(self.make_key(key, version))
+        return found or self.shared.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        """Increment key in the shared tier, where it is atomic."""
+        self.local.delete(self.make_key(key, version))
+        return self.shared.incr(key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        """Decrement key in the shared tier, where it is atomic."""
+        self.local.delete(self.make_key(key, version))
+        return self.shared.decr(key, delta, version)
+
+    def clear(self):
+        """Remove every key from both tiers."""
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        """Close the shared tier's connection, if it has one."""
+        self.shared.close(**kwargs)
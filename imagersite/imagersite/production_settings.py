@@ -1,6 +1,12 @@
 """Overwrite and add settings specifically for production deployed instance."""
+from django.core.exceptions import ImproperlyConfigured
 from imagersite.settings import *
 
+# Cached permissions, friend sets and gallery pages are invalidated through
+# the shared cache tier, which must be reachable from every process.
+if not MEMCACHED_LOCATION:
+    raise ImproperlyConfigured('MEMCACHED_LOCATION must be set in production.')
+
 DEBUG = False
 ALLOWED_HOSTS.append('.us-west-2.compute.amazonaws.com')
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
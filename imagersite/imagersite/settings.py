@@ -90,12 +90,39 @@ DATABASES = {
     'default': dj_database_url.config()
 }
 
+# A per-process LRU in front of memcached, or a local stand-in when
+# MEMCACHED_LOCATION is not set. The stand-in is private to each process,
+# so cached permissions, friend sets and gallery pages are then never
+# invalidated across processes: memcached is required whenever more than
+# one worker process runs, and production_settings refuses to start
+# without it.
+MEMCACHED_LOCATION = os.environ.get('MEMCACHED_LOCATION')
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        'LOCATION': 'image_cache_table',
-    }
+        'BACKEND': 'imagersite.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'imager-shared',
+    },
 }
+if MEMCACHED_LOCATION:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': MEMCACHED_LOCATION,
+    }
+
+AUTHENTICATION_BACKENDS = ['imager_profile.backends.CachedModelBackend']
+
+# Seconds a user's permission set is cached between requests.
+IMAGER_PERMISSION_CACHE_TIMEOUT = 300
+
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
 
@@ -128,6 +155,21 @@ USE_TZ = True
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Uploaded originals and their thumbnails are served by MediaView after
+# a visibility check.
+# Set to 'nginx' to hand the bytes to nginx with X-Accel-Redirect to an
+# internal location aliased to MEDIA_ROOT, or 'apache' for X-Sendfile.
+IMAGER_MEDIA_ACCEL = os.environ.get('IMAGER_MEDIA_ACCEL') or None
+IMAGER_MEDIA_ACCEL_PREFIX = os.environ.get(
+    'IMAGER_MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+# Uploads are stored once per distinct content, named by their hash.
+# Thumbnails already have generated names, so they use plain storage.
+# They are filed under their source's name, so MediaView can check them.
+DEFAULT_FILE_STORAGE = 'imager_images.storage.HashedStorage'
+THUMBNAIL_STORAGE = 'django.core.files.storage.FileSystemStorage'
+THUMBNAIL_BACKEND = 'imager_images.thumbnails.SourceNamedBackend'
+
 # STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 STATIC_URL = '/static/'
 STATICFILES_DIRS = (os.path.join(BASE_DIR, "static"), )
@@ -135,6 +177,13 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, "static"), )
 
 ACCOUNT_ACTIVATION_DAYS = 7
 
+# Worker threads pre-generating thumbnails after a Photo is saved.
+# Set to 0 to generate them inline in the saving process instead.
+IMAGER_THUMBNAIL_WORKERS = int(os.environ.get('IMAGER_THUMBNAIL_WORKERS', 2))
+
+# Worker threads verifying images of a bulk upload in parallel.
+IMAGER_UPLOAD_WORKERS = int(os.environ.get('IMAGER_UPLOAD_WORKERS', 4))
+
 LOGIN_REDIRECT_URL = '/profile'
 
 
@@ -0,0 +1,121 @@
+"""Tests for the two tier cache backend."""
+from __future__ import unicode_literals
+from django.core.cache import caches
+from django.test import TestCase
+from .cache import LocalLRU, TieredCache
+
+MAX_ENTRIES = 3
+
+
+class FakeClock(object):
+    """Clock for tests which only moves when told to."""
+
+    def __init__(self):
+        """Start the clock at zero."""
+        self.now = 0
+
+    def __call__(self):
+        """Return the current fake time."""
+        return self.now
+
+
+class LocalLRUCase(TestCase):
+    """Test the bounded, expiring local tier."""
+
+    def setUp(self):
+        """Set up an LRU holding a few entries on a fake clock."""
+        self.clock = FakeClock()
+        self.lru = LocalLRU(MAX_ENTRIES, clock=self.clock)
+
+    def test_get_set(self):
+        """Test that a stored value is found again."""
+        self.lru.set('key', 'value', 10)
+        self.assertEqual(self.lru.get('key'), (True, 'value'))
+
+    def test_miss(self):
+        """Test that an unknown key is not found."""
+        self.assertEqual(self.lru.get('key'), (False, None))
+
+    def test_expiry(self):
+        """Test that values are dropped once their ttl has passed."""
+        self.lru.set('key', 'value', 10)
+        self.clock.now = 10
+        self.assertEqual(self.lru.get('key'), (False, None))
+
+    def test_bounded(self):
+        """Test that the least recently used value is evicted first."""
+        for num in range(MAX_ENTRIES):
+            self.lru.set(num, num, 10)
+        self.lru.get(0)
+        self.lru.set('new', 'new', 10)
+        self.assertEqual(len(self.lru), MAX_ENTRIES)
+        self.assertFalse(self.lru.get(1)[0])
+        self.assertTrue(self.lru.get(0)[0])
+
+    def test_values_copied(self):
+        """Test that changing a fetched value does not change the store."""
+        self.lru.set('key', [1], 10)
+        self.lru.get('key')[1].append(2)
+        self.assertEqual(self.lru.get('key')[1], [1])
+
+
+class TieredCacheCase(TestCase):
+    """Test reads and writes across both tiers."""
+
+    def setUp(self):
+        """Set up a tiered cache in front of the shared test cache."""
+        self.shared = caches['shared']
+        self.shared.clear()
+        self.cache = TieredCache('shared', {
+            'OPTIONS': {'MAX_ENTRIES': MAX_ENTRIES, 'LOCAL_TIMEOUT': 60}})
+
+    def test_write_through(self):
+        """Test that set writes the shared tier too."""
+        self.cache.set('key', 'value')
+        self.assertEqual(self.shared.get('key'), 'value')
+
+    def test_local_hit(self):
+        """Test that a value just set is served by the local tier."""
+        self.cache.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.stats()['local_hits'], 1)
+
+    def test_shared_hit_fills_local(self):
+        """Test that a shared tier hit is kept locally afterwards."""
+        self.shared.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        stats = self.cache.stats()
+        self.assertEqual((stats['shared_hits'], stats['local_hits']), (1, 1))
+
+    def test_miss(self):
+        """Test that a key in neither tier gives the default."""
+        self.assertEqual(self.cache.get('key', 'default'), 'default')
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_delete_both(self):
+        """Test that delete removes the key from both tiers."""
+        self.cache.set('key', 'value')
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertIsNone(self.shared.get('key'))
+
+    def test_get_many(self):
+        """Test that get_many combines local and shared hits."""
+        self.cache.set('local', 1)
+        self.shared.set('shared', 2)
+        found = self.cache.get_many(['local', 'shared', 'missing'])
+        self.assertEqual(found, {'local': 1, 'shared': 2})
+        self.assertEqual(self.cache.stats(), {
+            'local_hits': 1, 'shared_hits': 1, 'misses': 1})
+
+    def test_incr_invalidates_local(self):
+        """Test that incr is seen through the local tier straight away."""
+        self.cache.set('count', 1)
+        self.cache.get('count')
+        self.assertEqual(self.cache.incr('count'), 2)
+        self.assertEqual(self.cache.get('count'), 2)
+
+    def test_default_is_tiered(self):
+        """Test that the default cache is a tiered cache."""
+        self.assertIsInstance(caches['default'], TieredCache)
@@ -1,11 +1,38 @@
 """Tests for profile, library, album and photo views."""
 from __future__ import unicode_literals
-from django.test import Client, TestCase, override_settings
+from django.test import (
+    Client,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
 from django.contrib.auth.models import User, Permission
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
 from imager_profile.tests import UserFactory
-from imager_images.tests import TMP_MEDIA_ROOT, AlbumFactory, PhotoFactory
+from imager_images.tests import (
+    TMP_MEDIA_ROOT,
+    AlbumFactory,
+    PhotoFactory,
+    make_upload,
+)
 from .test_auth import user_from_response
+from imager_images.feed import read_feed
+from imager_images.gallery import (
+    PAGE_KEY,
+    bump_gallery_version,
+    gallery_version,
+    make_cursor,
+)
 from imager_images.models import Photo, Album
+from imager_images.thumbnails import (
+    generate_renditions,
+    generate_srcset,
+    render,
+)
 import re
 
 MODELS = [
@@ -28,6 +55,8 @@ LOGIN = '/accounts/login/'
 LOGOUT = '/accounts/logout/'
 PROFILE = '/profile/'
 LIBRARY = '/images/library/'
+FEED = '/images/feed/'
+GALLERY = '/images/gallery/'
 ALBUM = '/images/album/'
 PHOTO = '/images/photo/'
 ALBUM_DETAIL = ALBUM + PK
@@ -37,6 +66,7 @@ EDIT_PHOTO = PHOTO_DETAIL + EDIT
 EDIT_PROFILE = PROFILE + EDIT
 ADD_ALBUM = ALBUM + ADD
 ADD_PHOTO = PHOTO + ADD
+UPLOAD_PHOTOS = PHOTO + 'upload/'
 
 NUM_USERS = 4
 NUM_ALBUMS = 4
@@ -312,6 +342,528 @@ class AuthenticatedCase(TestCase):
         pass
 
 
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class LibraryQueriesCase(TestCase):
+    """Test that the library page query count does not grow with content."""
+
+    def setUp(self):
+        """Log in one user who owns a single covered album."""
+        self.user = UserFactory.create()
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.add_albums(1)
+
+    def add_albums(self, num):
+        """Give the user num more albums, each with a cover and photos."""
+        for album in AlbumFactory.create_batch(num, owner=self.user):
+            photo_batch = PhotoFactory.create_batch(2, owner=self.user)
+            album.add_photos(photo_batch)
+            album.set_cover(photo_batch[0])
+
+    def count_queries(self):
+        """Count every query made to render the library page.
+
+        The page is rendered once beforehand so thumbnails already exist.
+        """
+        self.client.get(LIBRARY)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(LIBRARY)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_library_queries_constant(self):
+        """Test that more albums and photos cost no more queries."""
+        num_queries = self.count_queries()
+        self.add_albums(NUM_ALBUMS)
+        self.assertEqual(self.count_queries(), num_queries)
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class DetailVisibilityCase(TestCase):
+    """Test which users may reach photo and album detail pages."""
+
+    def setUp(self):
+        """Set up an owner's public and private items and another user."""
+        self.owner = UserFactory.create(username='Owner')
+        self.public_photo = PhotoFactory.create(
+            owner=self.owner, published='public')
+        self.private_photo = PhotoFactory.create(
+            owner=self.owner, published='private')
+        self.private_album = AlbumFactory.create(
+            owner=self.owner, published='private')
+        self.owner_client = Client()
+        self.owner_client.force_login(self.owner)
+        self.other_client = Client()
+        self.other_client.force_login(UserFactory.create(username='Other'))
+
+    def test_owner_sees_private(self):
+        """Test that owners can view their own private items."""
+        for url in (PHOTO_DETAIL.format(self.private_photo.pk),
+                    ALBUM_DETAIL.format(self.private_album.pk)):
+            self.assertEqual(self.owner_client.get(url).status_code, 200)
+
+    def test_other_sees_public(self):
+        """Test that other users can view public photos."""
+        response = self.other_client.get(
+            PHOTO_DETAIL.format(self.public_photo.pk))
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_not_private(self):
+        """Test that private items are not found for other users."""
+        for url in (PHOTO_DETAIL.format(self.private_photo.pk),
+                    ALBUM_DETAIL.format(self.private_album.pk)):
+            self.assertEqual(self.other_client.get(url).status_code, 404)
+
+    def test_photo_lists_visible_albums(self):
+        """Test that a photo page links only albums the user may see."""
+        self.private_album.add_photos([self.public_photo])
+        url = PHOTO_DETAIL.format(self.public_photo.pk)
+        album_url = ALBUM_DETAIL.format(self.private_album.pk)
+        self.assertNotContains(self.other_client.get(url), album_url)
+        self.assertContains(self.owner_client.get(url), album_url)
+
+    def test_anonymous_not_private(self):
+        """Test that private photos are not found for anonymous users."""
+        response = Client().get(PHOTO_DETAIL.format(self.private_photo.pk))
+        self.assertEqual(response.status_code, 404)
+
+    def test_photo_srcset(self):
+        """Test that the photo page offers renditions, not only original."""
+        photo = PhotoFactory.create(
+            owner=self.owner, published='public',
+            img_file=make_upload('wide.jpg', size=(700, 500)))
+        generate_srcset(photo.img_file, photo.width)
+        response = self.other_client.get(PHOTO_DETAIL.format(photo.pk))
+        self.assertContains(response, '320w')
+        self.assertContains(response, photo.img_file.url + ' 700w')
+        self.assertNotContains(response,
+                               'src="{}"'.format(photo.img_file.url))
+
+    def test_friend_sees_shared(self):
+        """Test that friends can view shared items and their files."""
+        friend = UserFactory.create(username='Friend')
+        self.owner.profile.add_friend(friend)
+        photo = PhotoFactory.create(
+            owner=self.owner, published='shared',
+            img_file=make_upload('shared.jpg', 'green'))
+        album = AlbumFactory.create(owner=self.owner, published='shared')
+        client = Client()
+        client.force_login(friend)
+        for url in (PHOTO_DETAIL.format(photo.pk),
+                    ALBUM_DETAIL.format(album.pk), photo.img_file.url):
+            self.assertEqual(client.get(url).status_code, 200)
+            self.assertEqual(self.other_client.get(url).status_code, 404)
+
+    def test_album_hides_private_photos(self):
+        """Test that an album lists only the photos the user may see."""
+        album = AlbumFactory.create(owner=self.owner, published='public')
+        album.add_photos([self.public_photo, self.private_photo])
+        response = self.other_client.get(ALBUM_DETAIL.format(album.pk))
+        self.assertContains(response, PHOTO_DETAIL.format(
+            self.public_photo.pk))
+        self.assertNotContains(response, PHOTO_DETAIL.format(
+            self.private_photo.pk))
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class ConditionalDetailCase(TestCase):
+    """Test that unchanged detail pages are answered with 304."""
+
+    def setUp(self):
+        """Set up an owner's public album holding one public photo."""
+        self.owner = UserFactory.create(username='Owner')
+        self.photo = PhotoFactory.create(owner=self.owner, published='public')
+        self.album = AlbumFactory.create(owner=self.owner, published='public')
+        self.album.add_photos([self.photo])
+        self.client = Client()
+        self.client.force_login(self.owner)
+
+    def test_not_modified(self):
+        """Test that a current ETag gets 304 without rendering."""
+        for url in (PHOTO_DETAIL.format(self.photo.pk),
+                    ALBUM_DETAIL.format(self.album.pk)):
+            etag = self.client.get(url)['ETag']
+            with self.assertTemplateNotUsed('base.html'):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_no_last_modified(self):
+        """Test that no date is sent, which every viewer would share."""
+        url = PHOTO_DETAIL.format(self.photo.pk)
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = Client().get(url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 200)
+
+    def test_renditions_change_etag(self):
+        """Test that finishing the renditions makes old ETags stale."""
+        for url in (PHOTO_DETAIL.format(self.photo.pk),
+                    ALBUM_DETAIL.format(self.album.pk)):
+            etag = self.client.get(url)['ETag']
+            render(self.photo.img_file)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+    def test_edit_changes_etag(self):
+        """Test that editing the photo makes the old ETag stale."""
+        url = PHOTO_DETAIL.format(self.photo.pk)
+        etag = self.client.get(url)['ETag']
+        self.photo.title = 'Changed'
+        self.photo.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_album_membership_changes_etag(self):
+        """Test that removing a photo makes the album's old ETag stale."""
+        url = ALBUM_DETAIL.format(self.album.pk)
+        etag = self.client.get(url)['ETag']
+        self.album.remove_photos([self.photo])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_per_user(self):
+        """Test that another user's ETag does not match the owner's page."""
+        url = PHOTO_DETAIL.format(self.photo.pk)
+        other_etag = Client().get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=other_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unfriending_changes_etag(self):
+        """Test that a former friend's copy of an album page goes stale."""
+        shared = PhotoFactory.create(owner=self.owner, published='shared')
+        self.album.add_photos([shared])
+        friend = UserFactory.create()
+        self.owner.profile.add_friend(friend)
+        client = Client()
+        client.force_login(friend)
+        url = ALBUM_DETAIL.format(self.album.pk)
+        etag = client.get(url)['ETag']
+        self.owner.profile.friends.remove(friend.profile)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, PHOTO_DETAIL.format(shared.pk))
+
+    def test_invisible_not_found(self):
+        """Test that a private item is not found even with an ETag."""
+        self.photo.published = 'private'
+        self.photo.save()
+        response = Client().get(PHOTO_DETAIL.format(self.photo.pk),
+                                HTTP_IF_NONE_MATCH='"anything"')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class MediaCase(TestCase):
+    """Test serving uploads and thumbnails only to users who may see them."""
+
+    def setUp(self):
+        """Set up an owner's private photo and another user."""
+        self.owner = UserFactory.create(username='Owner')
+        self.photo = PhotoFactory.create(
+            owner=self.owner, published='private',
+            img_file=make_upload('secret.jpg', 'black'))
+        self.url = self.photo.img_file.url
+        self.owner_client = Client()
+        self.owner_client.force_login(self.owner)
+        self.other_client = Client()
+        self.other_client.force_login(UserFactory.create(username='Other'))
+
+    def test_owner_streamed(self):
+        """Test that the owner gets the file streamed back."""
+        response = self.owner_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('private', response['Cache-Control'])
+        with self.photo.img_file.storage.open(self.photo.img_file.name) as f:
+            self.assertEqual(b''.join(response.streaming_content), f.read())
+
+    def test_private_hidden(self):
+        """Test that other and anonymous users get 404 for private files."""
+        self.assertEqual(self.other_client.get(self.url).status_code, 404)
+        self.assertEqual(Client().get(self.url).status_code, 404)
+
+    def test_public_served(self):
+        """Test that anyone gets files of public photos."""
+        self.photo.published = 'public'
+        self.photo.save()
+        response = Client().get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_thumbnail_checked(self):
+        """Test that thumbnails are only served to users seeing the photo."""
+        thumbnail = generate_renditions(self.photo.img_file)['grid']
+        self.assertTrue(thumbnail.name.startswith(
+            'cache/' + self.photo.img_file.name + '/'))
+        url = thumbnail.url
+        self.assertEqual(self.owner_client.get(url).status_code, 200)
+        self.assertEqual(self.other_client.get(url).status_code, 404)
+        self.assertEqual(Client().get(url).status_code, 404)
+
+    def test_thumbnail_public(self):
+        """Test that anyone gets thumbnails of public photos."""
+        self.photo.published = 'public'
+        self.photo.save()
+        thumbnail = generate_renditions(self.photo.img_file)['grid']
+        response = Client().get(thumbnail.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_unknown_file(self):
+        """Test that files no photo uses are not found."""
+        response = self.owner_client.get('/media/img_files/nothing.jpg')
+        self.assertEqual(response.status_code, 404)
+
+    def test_accel_redirect(self):
+        """Test that nginx is handed the file without any body."""
+        with self.settings(IMAGER_MEDIA_ACCEL='nginx'):
+            response = self.owner_client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/' + self.photo.img_file.name)
+        self.assertFalse(response.content)
+
+    def test_sendfile(self):
+        """Test that apache is handed the file's path on disk."""
+        with self.settings(IMAGER_MEDIA_ACCEL='apache'):
+            response = self.owner_client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.photo.img_file.path)
+        self.assertFalse(response.content)
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class FeedViewCase(TestCase):
+    """Test the page listing what friends have shared."""
+
+    def setUp(self):
+        """Log in a user whose friend shared a photo and an album."""
+        self.user, self.friend = UserFactory.create_batch(2)
+        self.user.profile.add_friend(self.friend)
+        self.photo = PhotoFactory.create(owner=self.friend, published='shared')
+        self.album = AlbumFactory.create(owner=self.friend, published='public')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_feed_lists_shared(self):
+        """Test that the feed links to the friend's shared items."""
+        response = self.client.get(FEED)
+        self.assertContains(response, PHOTO_DETAIL.format(self.photo.pk))
+        self.assertContains(response, ALBUM_DETAIL.format(self.album.pk))
+
+    def test_feed_after_unfriending(self):
+        """Test that a former friend's shared items leave the feed."""
+        self.friend.profile.friends.remove(self.user.profile)
+        response = self.client.get(FEED)
+        self.assertNotContains(response, PHOTO_DETAIL.format(self.photo.pk))
+
+    def test_feed_login_required(self):
+        """Test that anonymous users are sent to log in."""
+        response = Client().get(FEED)
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT, IMAGER_GALLERY_PAGE_SIZE=2)
+class GalleryCase(TestCase):
+    """Test browsing public photos a page at a time."""
+
+    def setUp(self):
+        """Add three public photos and a shared one."""
+        bump_gallery_version()
+        owner = UserFactory.create()
+        self.photo_batch = PhotoFactory.create_batch(
+            3, owner=owner, published='public')
+        self.shared = PhotoFactory.create(owner=owner, published='shared')
+
+    def get_page_urls(self, response):
+        """Return set of photo detail urls linked on a gallery page."""
+        return set(re.findall(r'/images/photo/\d+/', response.content.decode(
+            'utf-8')))
+
+    def test_pages_newest_first(self):
+        """Test that following the next link walks every public photo."""
+        first = self.client.get(GALLERY)
+        self.assertEqual(self.get_page_urls(first), {
+            PHOTO_DETAIL.format(photo.pk) for photo in self.photo_batch[1:]})
+        second = self.client.get(GALLERY + first.context['next_url'])
+        self.assertEqual(self.get_page_urls(second), {
+            PHOTO_DETAIL.format(self.photo_batch[0].pk)})
+        self.assertNotIn('next_url', second.context)
+
+    def test_newest_published_first(self):
+        """Test that pages are ordered by when photos were made public."""
+        self.shared.published = 'public'
+        self.shared.save()
+        oldest = self.photo_batch[0]
+        oldest.published = 'private'
+        oldest.save()
+        oldest.published = 'public'
+        oldest.save()
+        response = self.client.get(GALLERY)
+        self.assertEqual(self.get_page_urls(response), {
+            PHOTO_DETAIL.format(photo.pk) for photo in (oldest, self.shared)})
+
+    def test_anonymous_from_cache(self):
+        """Test that a cached page is served to anonymous users unqueried."""
+        self.client.get(GALLERY)
+        with self.assertNumQueries(0):
+            response = self.client.get(GALLERY)
+        self.assertEqual(response.status_code, 200)
+
+    def test_publishing_refreshes(self):
+        """Test that a photo turning public shows on a cached page."""
+        self.client.get(GALLERY)
+        self.shared.published = 'public'
+        self.shared.save()
+        response = self.client.get(GALLERY)
+        self.assertIn(PHOTO_DETAIL.format(self.shared.pk),
+                      self.get_page_urls(response))
+
+    def test_renditions_refresh(self):
+        """Test that finishing a public photo's renditions shows them."""
+        newest = PhotoFactory.create(
+            published='public',
+            img_file=make_upload('fresh.jpg', 'plum', size=(41, 31)))
+        thumbnail = '/media/cache/{}/'.format(newest.img_file.name)
+        self.assertNotContains(self.client.get(GALLERY), thumbnail)
+        render(newest.img_file)
+        self.assertContains(self.client.get(GALLERY), thumbnail)
+
+    def test_unpublishing_refreshes(self):
+        """Test that a photo made private leaves a cached page."""
+        self.client.get(GALLERY)
+        newest = self.photo_batch[-1]
+        newest.published = 'private'
+        newest.save()
+        response = self.client.get(GALLERY)
+        self.assertNotIn(PHOTO_DETAIL.format(newest.pk),
+                         self.get_page_urls(response))
+
+    def test_bulk_unpublishing_refreshes(self):
+        """Test that photos made private by a bulk update leave the page."""
+        self.client.get(GALLERY)
+        pks = [photo.pk for photo in self.photo_batch]
+        Photo.objects.filter(pk__in=pks).update(published='private')
+        self.assertFalse(self.get_page_urls(self.client.get(GALLERY)))
+
+    @override_settings(IMAGER_GALLERY_CACHED_PAGES=0)
+    def test_later_pages_not_cached(self):
+        """Test that pages past the cached ones are read every time."""
+        self.client.get(GALLERY)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(GALLERY)
+        self.assertTrue(context.captured_queries)
+
+    def test_next_page_from_cache(self):
+        """Test that the page after a cached one is cached in turn."""
+        first = self.client.get(GALLERY)
+        self.client.get(GALLERY + first.context['next_url'])
+        with self.assertNumQueries(0):
+            self.client.get(GALLERY + first.context['next_url'])
+
+    def test_made_up_cursor_not_cached(self):
+        """Test that pages of cursors never handed out are read every time."""
+        params = {'page': 2, 'before': make_cursor(self.photo_batch[-1])}
+        self.client.get(GALLERY)
+        self.client.get(GALLERY, params)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(GALLERY, params)
+        self.assertTrue(context.captured_queries)
+        self.assertEqual(self.get_page_urls(response), {
+            PHOTO_DETAIL.format(photo.pk) for photo in self.photo_batch[:2]})
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is not found."""
+        response = self.client.get(GALLERY, {'before': 'x'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class GalleryCommitCase(TransactionTestCase):
+    """Test gallery changes against requests running alongside them."""
+
+    def test_page_cached_before_commit_dropped(self):
+        """Test that a page cached from rows before a commit is not kept."""
+        photo = PhotoFactory.create(published='private')
+        with transaction.atomic():
+            photo.published = 'public'
+            photo.save()
+            cache.set(PAGE_KEY.format('html', gallery_version(), 1, ''),
+                      ('', None))
+        response = self.client.get(GALLERY)
+        self.assertContains(response, PHOTO_DETAIL.format(photo.pk))
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA_ROOT)
+class BulkUploadCase(TestCase):
+    """Test uploading many images at once from the upload page."""
+
+    def setUp(self):
+        """Log in a user allowed to add photos, with one album."""
+        self.user = UserFactory.create()
+        perm = Permission.objects.get(codename='add_photo')
+        self.user.user_permissions.add(perm)
+        self.album = AlbumFactory.create(owner=self.user)
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_upload_page_ok(self):
+        """Test that the upload page can be reached by get."""
+        self.assertEqual(self.client.get(UPLOAD_PHOTOS).status_code, 200)
+
+    def test_upload_many(self):
+        """Test that each uploaded image becomes a photo in the album."""
+        uploads = [make_upload('pic{}.jpg'.format(num)) for num in range(3)]
+        response = self.client.post(UPLOAD_PHOTOS, {
+            'files': uploads,
+            'published': 'public',
+            'albums': [self.album.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.user.photos.count(), len(uploads))
+        self.assertEqual(self.album.photos.count(), len(uploads))
+        titles = set(self.user.photos.values_list('title', flat=True))
+        self.assertEqual(titles, {'pic0', 'pic1', 'pic2'})
+
+    def test_upload_fanned_out(self):
+        """Test that shared uploads reach the feeds of the owner's friends."""
+        friend, stranger = UserFactory.create_batch(2)
+        self.user.profile.add_friend(friend)
+        uploads = [make_upload('pic{}.jpg'.format(num), color=color)
+                   for num, color in enumerate(('red', 'green'))]
+        self.client.post(UPLOAD_PHOTOS, {
+            'files': uploads,
+            'published': 'shared',
+        })
+        self.assertEqual(
+            {entry.photo for entry in read_feed(friend)},
+            set(self.user.photos.all()))
+        self.assertEqual(len(read_feed(friend)), len(uploads))
+        self.assertFalse(read_feed(stranger))
+
+    def test_private_upload_not_fanned_out(self):
+        """Test that private uploads reach no friend's feed."""
+        friend = UserFactory.create()
+        self.user.profile.add_friend(friend)
+        self.client.post(UPLOAD_PHOTOS, {
+            'files': [make_upload('pic.jpg')],
+            'published': 'private',
+        })
+        self.assertEqual(self.user.photos.count(), 1)
+        self.assertFalse(read_feed(friend))
+
+    def test_upload_rejects_non_image(self):
+        """Test that nothing is created if any file is not an image."""
+        uploads = [make_upload('pic.jpg'),
+                   SimpleUploadedFile('notes.jpg', b'not an image')]
+        response = self.client.post(UPLOAD_PHOTOS, {
+            'files': uploads,
+            'published': 'private',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'notes.jpg', response.content)
+        self.assertFalse(self.user.photos.count())
+
+
 # No user may edit resources that do not belong to him or her
 # login redirect if not logged in
 # test that save redirects to library
@@ -17,6 +17,9 @@ from django.conf.urls import url, include
 from django.conf.urls.static import static
 from django.conf import settings
 from django.contrib import admin
+from imager_images.views import MediaView
+from sorl.thumbnail.conf import settings as thumbnail_settings
+import re
 from .views import HomeView
 
 
@@ -30,6 +33,11 @@ urlpatterns = [
     url(r'^api-auth/', include(
         'rest_framework.urls',
         namespace='rest_framework')),
+    url(r'^{}(?P<path>(?:img_files/|{}).+)$'.format(
+        settings.MEDIA_URL.lstrip('/'),
+        re.escape(thumbnail_settings.THUMBNAIL_PREFIX)),
+        MediaView.as_view(),
+        name='media'),
 ]
 
 